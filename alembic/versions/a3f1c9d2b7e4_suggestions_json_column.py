@@ -0,0 +1,34 @@
+"""Store suggestion session suggestions in a native JSON column
+
+Revision ID: a3f1c9d2b7e4
+Revises: 6e8d92bd331b
+Create Date: 2026-10-15 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f1c9d2b7e4'
+down_revision: Union[str, Sequence[str], None] = '6e8d92bd331b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('suggestion_sessions', 'suggestions_json',
+               existing_type=mysql.TEXT(),
+               type_=sa.JSON(),
+               existing_nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('suggestion_sessions', 'suggestions_json',
+               existing_type=sa.JSON(),
+               type_=mysql.TEXT(),
+               existing_nullable=False)
@@ -0,0 +1,29 @@
+"""Add a compound index for counting a client's bookings by status and date
+
+Revision ID: b8d3f5a2c9e7
+Revises: f1a6c2e8b3d9
+Create Date: 2026-10-15 16:07:52.381946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d3f5a2c9e7'
+down_revision: Union[str, Sequence[str], None] = 'f1a6c2e8b3d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_bookings_client_status_date', 'bookings',
+                    ['client_id', 'status', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_bookings_client_status_date', table_name='bookings')
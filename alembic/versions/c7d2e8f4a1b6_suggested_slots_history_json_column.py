@@ -0,0 +1,34 @@
+"""Store suggestion session slot history in a native JSON column
+
+Revision ID: c7d2e8f4a1b6
+Revises: a3f1c9d2b7e4
+Create Date: 2026-10-15 11:03:17.204569
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2e8f4a1b6'
+down_revision: Union[str, Sequence[str], None] = 'a3f1c9d2b7e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('suggestion_sessions', 'all_suggested_slots_json',
+               existing_type=mysql.TEXT(),
+               type_=sa.JSON(),
+               existing_nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('suggestion_sessions', 'all_suggested_slots_json',
+               existing_type=sa.JSON(),
+               type_=mysql.TEXT(),
+               existing_nullable=True)
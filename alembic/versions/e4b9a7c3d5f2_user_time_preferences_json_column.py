@@ -0,0 +1,39 @@
+"""Store user time preferences in a native JSON column
+
+Revision ID: e4b9a7c3d5f2
+Revises: c7d2e8f4a1b6
+Create Date: 2026-10-15 14:22:41.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9a7c3d5f2'
+down_revision: Union[str, Sequence[str], None] = 'c7d2e8f4a1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Values that are not valid JSON cannot be converted; they were ignored when read anyway
+    op.execute(
+        "UPDATE users SET time_preferences = NULL "
+        "WHERE time_preferences IS NOT NULL AND NOT JSON_VALID(time_preferences)"
+    )
+    op.alter_column('users', 'time_preferences',
+               existing_type=mysql.VARCHAR(length=500),
+               type_=sa.JSON(),
+               existing_nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('users', 'time_preferences',
+               existing_type=sa.JSON(),
+               type_=mysql.VARCHAR(length=500),
+               existing_nullable=True)
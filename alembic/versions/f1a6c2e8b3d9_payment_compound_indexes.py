@@ -0,0 +1,32 @@
+"""Add compound indexes for latest-payment and active-membership lookups
+
+Revision ID: f1a6c2e8b3d9
+Revises: e4b9a7c3d5f2
+Create Date: 2026-10-15 14:51:09.730415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a6c2e8b3d9'
+down_revision: Union[str, Sequence[str], None] = 'e4b9a7c3d5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_payments_client_status_paid_at', 'payments',
+                    ['client_id', 'status', sa.text('paid_at DESC')], unique=False)
+    op.create_index('idx_payments_status_active_until', 'payments',
+                    ['status', 'active_until'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_payments_status_active_until', table_name='payments')
+    op.drop_index('idx_payments_client_status_paid_at', table_name='payments')
@@ -11,6 +11,11 @@ def get_current_user_import():
     from app.routes.user import get_current_user
     return get_current_user
 
+def get_token_subject_import():
+    """Delayed import to avoid circular dependency"""
+    from app.routes.user import get_token_subject
+    return get_token_subject
+
 # Keep the old function name for backward compatibility
 def get_current_user_dependency():
     """Import dependency dynamically to avoid circular imports - BACKWARD COMPATIBILITY"""
@@ -19,7 +24,7 @@ def get_current_user_dependency():
 
 async def require_coach_role(current_user: User = Depends(get_current_user_import())) -> User:
     """Dependency to ensure the current user is a coach"""
-    if str(current_user.role) != "UserRole.COACH":
+    if current_user.role != UserRole.COACH:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied. Coach role required."
@@ -28,7 +33,7 @@ async def require_coach_role(current_user: User = Depends(get_current_user_impor
 
 async def require_client_role(current_user: User = Depends(get_current_user_import())) -> User:
     """Dependency to ensure the current user is a client"""
-    if str(current_user.role) != "UserRole.CLIENT":
+    if current_user.role != UserRole.CLIENT:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied. Client role required."
@@ -37,7 +42,7 @@ async def require_client_role(current_user: User = Depends(get_current_user_impo
 
 async def require_accountant_role(current_user: User = Depends(get_current_user_import())) -> User:
     """Dependency to ensure the current user is an accountant"""
-    if str(current_user.role) != "UserRole.ACCOUNTANT":
+    if current_user.role != UserRole.ACCOUNTANT:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied. Accountant role required."
@@ -58,11 +63,10 @@ def is_accountant(user: User) -> bool:
 
 def require_roles(allowed_roles: List[UserRole]):
     """Factory function to create a dependency that checks for specific roles"""
+    allowed = frozenset(allowed_roles)
+    roles_str = ", ".join(role.value for role in allowed_roles)
     def role_checker(current_user: User) -> User:
-        user_role_value = current_user.role.value if hasattr(current_user.role, 'value') else str(current_user.role)
-        allowed_role_values = [role.value for role in allowed_roles]
-        if user_role_value not in allowed_role_values:
-            roles_str = ", ".join(allowed_role_values)
+        if current_user.role not in allowed:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Access denied. Required roles: {roles_str}"
@@ -72,10 +76,9 @@ def require_roles(allowed_roles: List[UserRole]):
 
 def check_coach_client_relationship(current_user: User, target_client_id: int) -> bool:
     """Check if a coach has access to a specific client"""
-    user_role_value = current_user.role.value if hasattr(current_user.role, 'value') else str(current_user.role)
-    if user_role_value == UserRole.COACH.value:
+    if current_user.role == UserRole.COACH:
         # Check if the target client is in the coach's client list
-        client_ids = [client.id for client in current_user.clients]
+        client_ids = {client.id for client in current_user.clients}
         return target_client_id in client_ids
     return False
 
@@ -86,8 +89,7 @@ def check_self_or_coach_access(current_user: User, target_user_id: int) -> bool:
         return True
     
     # Coaches can access their clients' data
-    user_role_value = current_user.role.value if hasattr(current_user.role, 'value') else str(current_user.role)
-    if user_role_value == UserRole.COACH.value:
+    if current_user.role == UserRole.COACH:
         return check_coach_client_relationship(current_user, target_user_id)
     
     return False
@@ -2,12 +2,13 @@
 # CRUD operations for scheduling system
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
-from typing import List, Optional, Dict, Tuple
+from sqlalchemy import and_, func, insert, select, lambda_stmt, text
+from typing import List, Optional, Dict, Tuple, Iterator
 from datetime import datetime, timedelta
 
-from app.models.schedule import ScheduleSlot, ClientPlan, ClientPreference, PlanType, PlanRequestStatus
+from app.models.schedule import ScheduleSlot, ClientPlan, ClientPreference, PlanRequest, PlanType, PlanRequestStatus
 from app.models.user import User, UserRole
+from app.crud.user import invalidate_cached_user
 from app.models.booking import Booking
 
 
@@ -44,8 +45,30 @@ def get_slot_by_id(db: Session, slot_id: int) -> Optional[ScheduleSlot]:
     """Get schedule slot by ID"""
     return db.query(ScheduleSlot).filter(ScheduleSlot.id == slot_id).first()
 
-def get_available_slots_for_client(db: Session, client_id: int, week_start: datetime) -> List[ScheduleSlot]:
-    """Get available slots for a client based on their assigned coach, existing bookings, and preferences"""
+def get_slot_occupancies(db: Session, slot_ids: List[int], week_start: datetime) -> Dict[int, int]:
+    """Count non-cancelled bookings per slot for the given week in one grouped query"""
+    if not slot_ids:
+        return {}
+    week_end = week_start + timedelta(days=7)
+    # A booking belongs to its slot's occurrence this week when it falls in that slot's hour
+    rows = db.execute(
+        select(Booking.slot_id, func.count(Booking.id))
+        .join(ScheduleSlot, ScheduleSlot.id == Booking.slot_id)
+        .where(
+            Booking.slot_id.in_(slot_ids),
+            Booking.date >= week_start,
+            Booking.date < week_end,
+            Booking.status != "cancelled",
+            func.timestampdiff(text("HOUR"), week_start, Booking.date)
+            == ScheduleSlot.day_of_week * 24 + ScheduleSlot.start_hour
+        )
+        .group_by(Booking.slot_id)
+    ).all()
+    return dict(rows)
+
+def get_available_slots_with_occupancy(db: Session, client_id: int,
+                                       week_start: datetime) -> List[Tuple[ScheduleSlot, int]]:
+    """Get (slot, occupancy) pairs for a client based on their assigned coach, existing bookings, and preferences"""
     # Get client's assigned coach
     client_plan = get_client_plan(db, client_id)
     if not client_plan:
@@ -60,31 +83,12 @@ def get_available_slots_for_client(db: Session, client_id: int, week_start: date
     slots = get_schedule_slots(db, coach_id=coach_id, active_only=True)
     
     # Filter slots that aren't at capacity for this week
+    occupancies = get_slot_occupancies(db, [slot.id for slot in slots], week_start)
     available_slots = []
-    week_end = week_start + timedelta(days=7)
-    
     for slot in slots:
-        # Calculate the actual datetime for this slot in the given week
-        slot_datetime = week_start + timedelta(
-            days=slot.day_of_week,
-            hours=slot.start_hour
-        )
-        
-        if slot_datetime < week_start or slot_datetime >= week_end:
-            continue
-            
-        # Count existing bookings for this slot in this week
-        booking_count = db.query(Booking).filter(
-            and_(
-                Booking.slot_id == slot.id,
-                Booking.date >= slot_datetime,
-                Booking.date < slot_datetime + timedelta(hours=1),
-                Booking.status != "cancelled"
-            )
-        ).count()
-        
+        booking_count = occupancies.get(slot.id, 0)
         if booking_count < slot.capacity:
-            available_slots.append(slot)
+            available_slots.append((slot, booking_count))
     
     # Apply preference filtering if client has preferences
     if client_preference and client_preference.preferred_start_hour is not None and client_preference.preferred_end_hour is not None:
@@ -94,13 +98,14 @@ def get_available_slots_for_client(db: Session, client_id: int, week_start: date
         if client_preference.is_flexible:
             # Flexible: Show preferred times + 1 hour buffer on each side
             filtered_slots = []
-            for slot in available_slots:
+            for slot, booking_count in available_slots:
                 if (slot.start_hour >= preferred_start - 1 and 
                     slot.start_hour <= preferred_end + 1):
-                    filtered_slots.append(slot)
+                    filtered_slots.append((slot, booking_count))
             
             # Sort by preference: exact match first, then nearby
-            def preference_score(slot):
+            def preference_score(pair):
+                slot = pair[0]
                 if slot.start_hour >= preferred_start and slot.start_hour <= preferred_end:
                     return 0  # Perfect match
                 elif slot.start_hour == preferred_start - 1 or slot.start_hour == preferred_end + 1:
@@ -112,12 +117,16 @@ def get_available_slots_for_client(db: Session, client_id: int, week_start: date
             return filtered_slots
         else:
             # Strict: Only show slots within preferred time range
-            return [slot for slot in available_slots 
+            return [(slot, booking_count) for slot, booking_count in available_slots 
                    if slot.start_hour >= preferred_start and slot.start_hour <= preferred_end]
     
     # No preferences set - return all available slots
     return available_slots
 
+def get_available_slots_for_client(db: Session, client_id: int, week_start: datetime) -> List[ScheduleSlot]:
+    """Get available slots for a client based on their assigned coach, existing bookings, and preferences"""
+    return [slot for slot, _ in get_available_slots_with_occupancy(db, client_id, week_start)]
+
 def seed_weekly_schedule(db: Session) -> bool:
     """Seed the database with standard weekly schedule slots"""
     try:
@@ -134,7 +143,15 @@ def seed_weekly_schedule(db: Session) -> bool:
             print("⚠️ No coaches with shift hours found. Please set coach shifts first.")
             return False
         
-        slots_created = 0
+        # Load existing slot keys once instead of checking each slot individually
+        coach_ids = [coach.id for coach in coaches]
+        existing_keys = set(
+            db.query(ScheduleSlot.day_of_week, ScheduleSlot.start_hour, ScheduleSlot.coach_id)
+            .filter(ScheduleSlot.coach_id.in_(coach_ids))
+            .all()
+        )
+        
+        rows = []
         for coach in coaches:
             shift_start = getattr(coach, 'shift_start_hour', 10)
             shift_end = getattr(coach, 'shift_end_hour', 21)
@@ -146,18 +163,19 @@ def seed_weekly_schedule(db: Session) -> bool:
                     if hour >= 12 and hour <= 13:  # 12 PM (hour 12) and 1 PM (hour 13)
                         continue
                     
-                    # Check if slot already exists
-                    existing = db.query(ScheduleSlot).filter(
-                        and_(
-                            ScheduleSlot.day_of_week == day,
-                            ScheduleSlot.start_hour == hour,
-                            ScheduleSlot.coach_id == coach.id
-                        )
-                    ).first()
-                    
-                    if not existing:
-                        create_schedule_slot(db, day, hour, coach.id)
-                        slots_created += 1
+                    if (day, hour, coach.id) not in existing_keys:
+                        rows.append({
+                            "day_of_week": day,
+                            "start_hour": hour,
+                            "coach_id": coach.id,
+                            "capacity": 10
+                        })
+        
+        # Single executemany insert and one commit for all new slots
+        if rows:
+            db.execute(insert(ScheduleSlot), rows)
+            db.commit()
+        slots_created = len(rows)
         
         print(f"✅ Created {slots_created} schedule slots")
         return True
@@ -170,13 +188,11 @@ def seed_weekly_schedule(db: Session) -> bool:
 
 # ==================== CLIENT PLANS ====================
 
-def create_client_plan(db: Session, client_id: int, plan_type: PlanType, 
-                      assigned_coach_id: int) -> ClientPlan:
-    """Create or update client plan"""
-    from app.models.user import User
-    
+def _stage_client_plan(db: Session, client_id: int, plan_type: PlanType,
+                       assigned_coach_id: int) -> ClientPlan:
+    """Stage a client plan (replacing any existing one) without committing"""
     # Remove existing plan for this client
-    existing = db.query(ClientPlan).filter(ClientPlan.client_id == client_id).first()
+    existing = get_client_plan(db, client_id)
     if existing:
         db.delete(existing)
 
@@ -197,21 +213,35 @@ def create_client_plan(db: Session, client_id: int, plan_type: PlanType,
     db.add(plan)
     
     # Also update the Users table plan field
-    user = db.query(User).filter(User.id == client_id).first()
+    user = db.get(User, client_id)
     if user:
         user.plan = plan_type.value  # Store the enum value as string
     
+    return plan
+
+def _invalidate_cached_client(db: Session, client_id: int) -> None:
+    """Drop the client's cached user row. Call after commit, so a concurrent
+    request cannot read the old row and cache the previous plan again."""
+    user = db.get(User, client_id)  # already in the identity map, no query
+    if user:
+        invalidate_cached_user(user.email)
+
+def create_client_plan(db: Session, client_id: int, plan_type: PlanType, 
+                      assigned_coach_id: int) -> ClientPlan:
+    """Create or update client plan"""
+    plan = _stage_client_plan(db, client_id, plan_type, assigned_coach_id)
     db.commit()
+    _invalidate_cached_client(db, client_id)
     db.refresh(plan)
     return plan
 
 def get_client_plan(db: Session, client_id: int) -> Optional[ClientPlan]:
     """Get client's current plan"""
-    return db.query(ClientPlan).filter(ClientPlan.client_id == client_id).first()
+    return db.execute(select(ClientPlan).where(ClientPlan.client_id == client_id)).scalar_one_or_none()
 
 def get_clients_for_coach(db: Session, coach_id: int) -> List[ClientPlan]:
     """Get all clients assigned to a coach"""
-    return db.query(ClientPlan).filter(ClientPlan.assigned_coach_id == coach_id).all()
+    return list(db.execute(select(ClientPlan).where(ClientPlan.assigned_coach_id == coach_id)).scalars())
 
 
 # ==================== CLIENT PREFERENCES ====================
@@ -222,7 +252,7 @@ def create_or_update_client_preference(db: Session, client_id: int,
                                      is_flexible: bool = False) -> ClientPreference:
     """Create or update client scheduling preferences"""
     # Remove existing preference
-    existing = db.query(ClientPreference).filter(ClientPreference.client_id == client_id).first()
+    existing = get_client_preference(db, client_id)
     if existing:
         db.delete(existing)
     
@@ -239,11 +269,33 @@ def create_or_update_client_preference(db: Session, client_id: int,
 
 def get_client_preference(db: Session, client_id: int) -> Optional[ClientPreference]:
     """Get client's scheduling preferences"""
-    return db.query(ClientPreference).filter(ClientPreference.client_id == client_id).first()
+    return db.execute(
+        select(ClientPreference).where(ClientPreference.client_id == client_id).limit(1)
+    ).scalar_one_or_none()
+
+def get_client_preference_row(db: Session, client_id: int) -> Optional[dict]:
+    """Get client's scheduling preferences as a plain dict (read-only, no ORM object)"""
+    # client_id is unique (unique_client_prefs), so this is a single index lookup
+    row = db.execute(
+        select(ClientPreference.__table__).where(ClientPreference.client_id == client_id).limit(1)
+    ).mappings().first()
+    return dict(row) if row else None
+
+def get_client_preference_by_id(db: Session, preference_id: int) -> Optional[ClientPreference]:
+    """Get client preference by ID"""
+    return db.execute(select(ClientPreference).where(ClientPreference.id == preference_id)).scalar_one_or_none()
 
 def get_all_client_preferences(db: Session) -> List[ClientPreference]:
     """Get all client preferences"""
-    return db.query(ClientPreference).all()
+    return list(db.execute(select(ClientPreference)).scalars())
+
+def iter_client_preference_rows(db: Session, batch_size: int = 500) -> Iterator[dict]:
+    """Stream all client preferences as plain dicts using a server-side cursor"""
+    result = db.execute(
+        select(ClientPreference.__table__).execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for row in result.mappings():
+        yield dict(row)
 
 
 # ==================== SCHEDULING ANALYTICS ====================
@@ -306,16 +358,26 @@ def get_week_schedule_summary(db: Session, week_start: datetime) -> Dict[str, an
 
 # ==================== PLAN REQUESTS ====================
 
-def create_plan_request(db: Session, client_id: int, coach_id: int, message: Optional[str] = None):
-    """Create a plan request from client to coach"""
-    from app.models.schedule import PlanRequest
-    
-    # Check if there's already a pending request
-    existing = db.query(PlanRequest).filter(
+# lambda_stmt caches the compiled SQL per call site; only the bound values change
+
+def get_plan_request_by_id(db: Session, request_id: int) -> Optional[PlanRequest]:
+    """Get plan request by ID"""
+    stmt = lambda_stmt(lambda: select(PlanRequest).where(PlanRequest.id == request_id))
+    return db.execute(stmt).scalar_one_or_none()
+
+def get_pending_plan_request(db: Session, client_id: int, coach_id: int) -> Optional[PlanRequest]:
+    """Get the pending plan request from a client to a coach, if any"""
+    stmt = lambda_stmt(lambda: select(PlanRequest).where(
         PlanRequest.client_id == client_id,
         PlanRequest.coach_id == coach_id,
         PlanRequest.status == PlanRequestStatus.PENDING
-    ).first()
+    ))
+    return db.execute(stmt).scalars().first()
+
+def create_plan_request(db: Session, client_id: int, coach_id: int, message: Optional[str] = None):
+    """Create a plan request from client to coach"""
+    # Check if there's already a pending request
+    existing = get_pending_plan_request(db, client_id, coach_id)
     
     if existing:
         return existing  # Return existing pending request
@@ -333,26 +395,32 @@ def create_plan_request(db: Session, client_id: int, coach_id: int, message: Opt
 
 def get_plan_requests_for_coach(db: Session, coach_id: int, status: Optional[str] = None):
     """Get plan requests for a specific coach"""
-    from app.models.schedule import PlanRequest
-    
-    query = db.query(PlanRequest).filter(PlanRequest.coach_id == coach_id)
+    stmt = select(PlanRequest).where(PlanRequest.coach_id == coach_id)
     if status:
-        query = query.filter(PlanRequest.status == status)
-    return query.order_by(PlanRequest.created_at.desc()).all()
+        stmt = stmt.where(PlanRequest.status == status)
+    return list(db.execute(stmt.order_by(PlanRequest.created_at.desc())).scalars())
 
 def get_plan_requests_for_client(db: Session, client_id: int):
     """Get plan requests made by a specific client"""
-    from app.models.schedule import PlanRequest
-    
-    return db.query(PlanRequest).filter(
+    stmt = select(PlanRequest).where(
         PlanRequest.client_id == client_id
-    ).order_by(PlanRequest.created_at.desc()).all()
+    ).order_by(PlanRequest.created_at.desc())
+    return list(db.execute(stmt).scalars())
+
+def get_plan_request_rows(db: Session, client_id: Optional[int] = None,
+                          coach_id: Optional[int] = None) -> List[dict]:
+    """Get plan requests as plain dicts for read-only responses (newest first)"""
+    table = PlanRequest.__table__
+    stmt = select(table)
+    if client_id is not None:
+        stmt = stmt.where(table.c.client_id == client_id)
+    if coach_id is not None:
+        stmt = stmt.where(table.c.coach_id == coach_id)
+    return [dict(row) for row in db.execute(stmt.order_by(table.c.created_at.desc())).mappings()]
 
-def update_plan_request(db: Session, request_id: int, status: str, response_message: Optional[str] = None):
+def update_plan_request(db: Session, request_id: int, status: PlanRequestStatus, response_message: Optional[str] = None):
     """Update plan request status (approve/reject)"""
-    from app.models.schedule import PlanRequest
-    
-    request = db.query(PlanRequest).filter(PlanRequest.id == request_id).first()
+    request = get_plan_request_by_id(db, request_id)
     if not request:
         return None
     
@@ -362,4 +430,26 @@ def update_plan_request(db: Session, request_id: int, status: str, response_mess
     
     db.commit()
     db.refresh(request)
-    return request
\ No newline at end of file
+    return request
+
+def approve_plan_request(db: Session, plan_request, plan_type: PlanType,
+                         response_message: Optional[str] = None):
+    """Approve a plan request and create the client's plan in a single transaction"""
+    try:
+        # SAVEPOINT: a failed plan insert rolls back the status change as well
+        with db.begin_nested():
+            plan_request.status = PlanRequestStatus.APPROVED
+            if response_message:
+                plan_request.response_message = response_message
+            _stage_client_plan(
+                db,
+                client_id=plan_request.client_id,
+                plan_type=plan_type,
+                assigned_coach_id=plan_request.coach_id
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    _invalidate_cached_client(db, plan_request.client_id)
+    return plan_request
\ No newline at end of file
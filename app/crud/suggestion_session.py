@@ -0,0 +1,98 @@
+# crud/suggestion_session.py
+# Lookups for AI suggestion sessions
+
+from typing import List, Optional, Tuple
+
+from sqlalchemy import JSON, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from app.models.suggestion_session import SuggestionSession
+from app.models.user import User
+
+
+def get_active_session(db: Session, session_token: str) -> Optional[SuggestionSession]:
+    """Get an active suggestion session by its token"""
+    return db.execute(
+        select(SuggestionSession).where(
+            SuggestionSession.session_token == session_token,
+            SuggestionSession.is_active == True
+        )
+    ).scalar_one_or_none()
+
+def get_session_with_owner(db: Session, session_token: str,
+                           owner_email: str) -> Optional[Tuple[User, SuggestionSession]]:
+    """Get (user, session) for an active session owned by the given user, in one joined query"""
+    row = db.execute(
+        select(User, SuggestionSession)
+        .join(SuggestionSession, SuggestionSession.client_id == User.id)
+        .where(
+            SuggestionSession.session_token == session_token,
+            SuggestionSession.is_active == True,
+            User.email == owner_email
+        )
+    ).first()
+    return (row[0], row[1]) if row else None
+
+def _history_with(slot_ids: List[int]):
+    """SQL expression appending slot IDs to the stored suggestion history"""
+    return func.json_merge_preserve(
+        func.coalesce(SuggestionSession.all_suggested_slots_json, func.json_array()),
+        literal(slot_ids, JSON)
+    )
+
+def store_suggestions(db: Session, session_id: int, suggestions: List[dict],
+                      history_slot_ids: List[int]) -> None:
+    """Store new suggestions and append to the history in a single UPDATE"""
+    values = {"suggestions_json": suggestions}
+    if history_slot_ids:
+        values["all_suggested_slots_json"] = _history_with(history_slot_ids)
+    db.execute(
+        update(SuggestionSession)
+        .where(SuggestionSession.id == session_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+def replace_suggestion(db: Session, session_id: int, position: int, suggestion: dict,
+                       history_slot_ids: List[int]) -> None:
+    """Replace one suggestion in place (JSON_SET) and append to the history in a single UPDATE"""
+    values = {
+        "suggestions_json": func.json_set(
+            SuggestionSession.suggestions_json,
+            f"$[{int(position)}]",
+            # JSON_EXTRACT(..., '$') makes MySQL treat the value as a JSON object, not a string
+            func.json_extract(literal(suggestion, JSON), "$")
+        )
+    }
+    if history_slot_ids:
+        values["all_suggested_slots_json"] = _history_with(history_slot_ids)
+    db.execute(
+        update(SuggestionSession)
+        .where(SuggestionSession.id == session_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+def get_session_snapshot(db: Session, session_token: str) -> Optional[dict]:
+    """Get a read-only snapshot (client, expiry, suggestions) of an active session"""
+    # Only the columns the snapshot needs; no ORM entity is built
+    row = db.execute(
+        select(
+            SuggestionSession.id,
+            SuggestionSession.client_id,
+            SuggestionSession.expires_at,
+            SuggestionSession.suggestions_json
+        ).where(
+            SuggestionSession.session_token == session_token,
+            SuggestionSession.is_active == True
+        )
+    ).first()
+    if not row:
+        return None
+
+    return {
+        "id": row.id,
+        "client_id": row.client_id,
+        "expires_at": row.expires_at,
+        "suggestions": row.suggestions_json or []
+    }
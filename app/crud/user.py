@@ -1,10 +1,13 @@
 # crud/user.py
 from app.schemas.user import UserCreate, UserUpdate
-from sqlalchemy.orm import Session
-from app.models.user import User, UserRole
+from sqlalchemy.orm import Session, aliased, make_transient_to_detached
+from sqlalchemy import and_, delete, exists, func, inspect, or_, select
+from app.models.user import User, UserRole, coach_client_association
 from passlib.context import CryptContext
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from fastapi import HTTPException
+import threading
+import time
 
 
 # Setup bcrypt hasher
@@ -16,13 +19,66 @@ def get_password_hash(password: str) -> str:
 
 # Utility to check if user already exists
 def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+    return db.execute(select(User).where(User.email == email)).scalar_one_or_none()
+
+# Column values of recently authenticated users keyed by email -- plain dicts, never
+# ORM instances, so nothing is shared between sessions or threads
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_ENTRIES = 5000
+_user_cache: Dict[str, Tuple[float, dict]] = {}
+_user_cache_lock = threading.Lock()
+# Read from the table, not inspect(User): that would configure every mapper at import,
+# before models referenced by name in relationships (e.g. Payment) are loaded
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+def get_user_by_email_cached(db: Session, email: str) -> Optional[User]:
+    """Get a user by email, skipping the SELECT when the row was loaded recently.
+
+    Only for authentication and reads of the user's own columns. On a cache hit the
+    user is rebuilt from the stored column values as a detached, read-only object:
+    relationships (clients, coaches, payments) are not loaded and cannot be, so
+    callers that need them must query by id. It is never added to the session, so
+    later queries in the request still read the row from the database. Writers must
+    load their own copy with get_user_for_update() and call invalidate_cached_user()
+    afterwards.
+    """
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(email)
+    if cached and cached[0] > now:
+        user = User(**cached[1])
+        make_transient_to_detached(user)
+        return user
+
+    user = get_user_by_email(db, email)
+    if user is None:
+        return None
+    values = {key: getattr(user, key) for key in _USER_COLUMNS}
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+            for stale_email in [k for k, (exp, _) in _user_cache.items() if exp <= now]:
+                del _user_cache[stale_email]
+            if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+                _user_cache.clear()
+        _user_cache[email] = (now + USER_CACHE_TTL_SECONDS, values)
+    return user
+
+def invalidate_cached_user(email: str) -> None:
+    """Drop a cached user after its row has been modified"""
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
+
+def get_user_for_update(db: Session, user: User) -> User:
+    """Return a copy of `user` that belongs to this session, loading it if `user` is a cached snapshot"""
+    if inspect(user).session is db:
+        return user
+    return db.get(User, user.id)
 
 def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+    return db.execute(select(User).where(User.username == username)).scalar_one_or_none()
 
 def get_user_by_id(db: Session, user_id: int):
-    return db.query(User).filter(User.id == user_id).first()
+    return db.execute(select(User).where(User.id == user_id)).scalar_one_or_none()
 
 # Create and save a new user by using the db session which is from SQLAlchemy which let us add and commit and refresh the user object
 def create_user(db: Session, user: UserCreate) -> User:
@@ -48,7 +104,7 @@ def verify_password(plain_password, hashed_password):
 
 # Function to authenticate user by checking email and password
 def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user_by_email(db, email)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
@@ -57,6 +113,8 @@ def authenticate_user(db: Session, email: str, password: str):
 
 def update_user(db: Session, db_user: User, user_update: UserUpdate) -> User:
     data = user_update.dict(exclude_unset=True)
+    db_user = get_user_for_update(db, db_user)
+    invalidate_cached_user(db_user.email)
 
     # if they passed password, hash it
     if "password" in data:
@@ -66,13 +124,26 @@ def update_user(db: Session, db_user: User, user_update: UserUpdate) -> User:
     for field, value in data.items():
         setattr(db_user, field, value)
 
-    db.add(db_user)
     db.commit()
+    invalidate_cached_user(db_user.email)
     db.refresh(db_user)
     return db_user
 
 def delete_user(db: Session, db_user: User) -> None:
-    db.delete(db_user)
+    invalidate_cached_user(db_user.email)
+    # Plain DELETE statements instead of the unit of work, which would first load
+    # the coaches/clients collections just to clear the association rows
+    db.execute(
+        delete(coach_client_association).where(or_(
+            coach_client_association.c.coach_id == db_user.id,
+            coach_client_association.c.client_id == db_user.id
+        ))
+    )
+    db.execute(
+        delete(User)
+        .where(User.id == db_user.id)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
 
 # ==== COACH-CLIENT RELATIONSHIP FUNCTIONS ====
@@ -81,18 +152,81 @@ def get_all_coaches(db: Session) -> List[User]:
     """Get all users with coach role"""
     return db.query(User).filter(User.role == UserRole.COACH).all()
 
-def get_all_clients(db: Session) -> List[User]:
-    """Get all users with client role"""
-    # Load clients first, then access coaches relationship as needed
-    # This avoids potential circular loading issues with Payment model
-    return db.query(User).filter(User.role == UserRole.CLIENT).all()
+def get_clients_with_primary_coach(db: Session, search_term: Optional[str] = None):
+    """Get client rows with their assigned coach's columns in a single query (no ORM objects)"""
+    Coach = aliased(User)
+    # A client has at most one coach; MIN() keeps it to one row per client regardless
+    primary_coach = (
+        select(
+            coach_client_association.c.client_id,
+            func.min(coach_client_association.c.coach_id).label("coach_id")
+        )
+        .group_by(coach_client_association.c.client_id)
+        .subquery()
+    )
+    query = (
+        select(
+            User.id, User.username, User.email, User.first_name, User.last_name,
+            User.phone, User.created_at,
+            Coach.id.label("coach_id"),
+            Coach.username.label("coach_username"),
+            Coach.first_name.label("coach_first_name"),
+            Coach.last_name.label("coach_last_name"),
+            Coach.phone.label("coach_phone")
+        )
+        .outerjoin(primary_coach, primary_coach.c.client_id == User.id)
+        .outerjoin(Coach, Coach.id == primary_coach.c.coach_id)
+        .where(User.role == UserRole.CLIENT)
+    )
+
+    if search_term:
+        search_filter = f"%{search_term}%"
+        query = query.where(
+            (User.username.like(search_filter)) |
+            (User.email.like(search_filter)) |
+            (User.first_name.like(search_filter)) |
+            (User.last_name.like(search_filter))
+        )
+
+    return db.execute(query).all()
+
+def get_client_profile_for_coach(db: Session, coach_id: int, client_id: int):
+    """Get a client's profile columns, whether they are assigned to the coach, and their
+    latest paid membership -- all in one query. Returns None if the client does not exist."""
+    from app.models.payment import Payment, PaymentStatus
+
+    is_assigned = exists().where(
+        coach_client_association.c.coach_id == coach_id,
+        coach_client_association.c.client_id == client_id
+    )
+    return db.execute(
+        select(
+            User.id, User.username, User.email, User.first_name, User.last_name,
+            User.phone, User.created_at,
+            is_assigned.label("is_assigned"),
+            Payment.id.label("payment_id"), Payment.paid_at,
+            Payment.active_until, Payment.plan_name
+        )
+        .outerjoin(Payment, and_(
+            Payment.client_id == User.id,
+            Payment.status == PaymentStatus.PAID
+        ))
+        .where(User.id == client_id, User.role == UserRole.CLIENT)
+        .order_by(Payment.paid_at.desc())
+        .limit(1)
+    ).first()
 
 def get_coach_clients(db: Session, coach_id: int) -> List[User]:
     """Get all clients for a specific coach"""
-    coach = db.query(User).filter(User.id == coach_id, User.role == UserRole.COACH).first()
-    if not coach:
-        return []
-    return coach.clients
+    # Join through coach_clients directly instead of loading the coach and then
+    # lazy-loading coach.clients (two round-trips)
+    Coach = aliased(User)
+    return db.execute(
+        select(User)
+        .join(coach_client_association, coach_client_association.c.client_id == User.id)
+        .join(Coach, Coach.id == coach_client_association.c.coach_id)
+        .where(Coach.id == coach_id, Coach.role == UserRole.COACH)
+    ).scalars().all()
 
 def get_client_coaches(db: Session, client_id: int) -> List[User]:
     """Get all coaches for a specific client"""
@@ -136,29 +270,27 @@ def remove_client_from_coach(db: Session, coach_id: int, client_id: int) -> bool
     db.commit()
     return True
 
-def is_coach_client_relationship(db: Session, coach_id: int, client_id: int) -> bool:
-    """Check if a client belongs to a specific coach or still new"""
-    coach = db.query(User).filter(User.id == coach_id, User.role == UserRole.COACH).first()
-    if not coach:
-        return False
-    
-    client = db.query(User).filter(User.id == client_id, User.role == UserRole.CLIENT).first()
-    if not client:
-        return False
-    
-    return client in coach.clients
+def validate_coach_can_assign(db: Session, coach_id: int, client_id: int):
+    """Get (role, has_active_subscription, is_assigned) for a client in one query, for
+    plan assignment checks. Returns None if the user does not exist."""
+    from app.services.subscriptions import active_subscription_exists
 
-def search_users_by_role(db: Session, role: UserRole, search_term: Optional[str] = None) -> List[User]:
-    """Search users by role and optional search term"""
-    query = db.query(User).filter(User.role == role)
-    
-    if search_term:
-        search_filter = f"%{search_term}%"
-        query = query.filter(
-            (User.username.like(search_filter)) |
-            (User.email.like(search_filter)) |
-            (User.first_name.like(search_filter)) |
-            (User.last_name.like(search_filter))
-        )
-    
-    return query.all()
\ No newline at end of file
+    return db.execute(
+        select(
+            User.role,
+            active_subscription_exists(User.id).label("has_active_subscription"),
+            exists().where(
+                coach_client_association.c.coach_id == coach_id,
+                coach_client_association.c.client_id == User.id
+            ).label("is_assigned")
+        ).where(User.id == client_id)
+    ).first()
+
+def coach_has_client(db: Session, coach_id: int, client_id: int) -> bool:
+    """Check whether a client is assigned to a coach with an EXISTS query (no rows loaded)"""
+    return db.execute(
+        select(exists().where(
+            coach_client_association.c.coach_id == coach_id,
+            coach_client_association.c.client_id == client_id
+        ))
+    ).scalar() is True
@@ -1,8 +1,10 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 from app.models.workout import WorkoutTemplate, WorkoutPlan
 from app.models.user import User
 from app.models.booking import Booking
+from app.crud.user import invalidate_cached_user
 from app.schemas.workout import WorkoutTemplateCreate, WorkoutPlanCreate
 
 # Workout Template CRUD
@@ -22,6 +24,12 @@ def get_workout_template(db: Session, template_id: int):
 def get_templates_by_muscle_group(db: Session, muscle_group: str):
     return db.query(WorkoutTemplate).filter(WorkoutTemplate.muscle_group == muscle_group).all()
 
+def get_templates_by_muscle_groups(db: Session, muscle_groups: List[str]):
+    """Get the templates for several muscle groups in one IN query"""
+    return db.execute(
+        select(WorkoutTemplate).where(WorkoutTemplate.muscle_group.in_(muscle_groups))
+    ).scalars().all()
+
 # Workout Plan CRUD (Simplified)
 def create_workout_plan(db: Session, plan: WorkoutPlanCreate, coach_id: int):
     db_plan = WorkoutPlan(
@@ -56,6 +64,7 @@ def assign_plan_to_client(db: Session, client_id: int, plan_name: str):
     if user:
         setattr(user, 'plan', plan_name)
         db.commit()
+        invalidate_cached_user(user.email)
         db.refresh(user)
     return user
 
@@ -86,8 +95,11 @@ def update_booking_workout(db: Session, booking_id: int, workout_day: Optional[s
         db.refresh(booking)
     return booking
 
-def get_pending_coach_decisions(db: Session, coach_id: int):
-    return db.query(Booking).filter(
-        Booking.coach_id == coach_id,
-        Booking.coach_decision_requested == "yes"
+def get_pending_coach_decision_rows(db: Session, coach_id: int):
+    """(id, client_id, date) of bookings awaiting the coach's workout decision, without ORM objects"""
+    return db.execute(
+        select(Booking.id, Booking.client_id, Booking.date).where(
+            Booking.coach_id == coach_id,
+            Booking.coach_decision_requested == "yes"
+        )
     ).all()
@@ -5,12 +5,16 @@ import os
 import json
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, Optional, Tuple
 from fastapi import HTTPException, Request
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive connections held to the PayPal API
+PAYPAL_HTTP_POOL_SIZE = 32
+
 class PayPalConfig:
     def __init__(self):
         self.env = os.getenv("PAYPAL_ENVIRONMENT", "sandbox")  # Match your .env file
@@ -34,6 +38,15 @@ class PayPalClient:
         self.config = PayPalConfig()
         self._access_token = None
         self._token_expires_at = 0
+        # One pooled HTTP session for all PayPal calls: the TCP connection and TLS
+        # session are reused, so webhook verification doesn't pay a handshake each time.
+        # Webhooks run in threadpool workers, so keep enough idle connections for a burst.
+        self._http = requests.Session()
+        self._http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=PAYPAL_HTTP_POOL_SIZE))
+    
+    def close(self) -> None:
+        """Close pooled connections (called on application shutdown)"""
+        self._http.close()
     
     def _get_access_token(self) -> str:
         """Get or refresh PayPal access token using client credentials flow"""
@@ -50,7 +63,7 @@ class PayPalClient:
         data = "grant_type=client_credentials"
         
         try:
-            response = requests.post(
+            response = self._http.post(
                 url,
                 headers=headers,
                 data=data,
@@ -109,7 +122,7 @@ class PayPalClient:
         }
         
         try:
-            response = requests.post(url, headers=headers, json=order_data, timeout=30)
+            response = self._http.post(url, headers=headers, json=order_data, timeout=30)
             response.raise_for_status()
             
             order = response.json()
@@ -149,7 +162,7 @@ class PayPalClient:
         }
         
         try:
-            response = requests.post(url, headers=headers, timeout=30)
+            response = self._http.post(url, headers=headers, timeout=30)
             response.raise_for_status()
             
             capture_data = response.json()
@@ -207,7 +220,7 @@ class PayPalClient:
         }
         
         try:
-            response = requests.post(
+            response = self._http.post(
                 verification_url,
                 headers=verification_headers,
                 json=verification_data,
@@ -2,22 +2,38 @@
 # to open the interactive API documentation, navigate to: http://localhost:8000/docs
 # or PS: -m uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from app.routes import user
 from app.routes import booking, workout, payments_paypal, webhooks_paypal, payment_pages, schedule
 import os
+import anyio.to_thread
+from app.integrations.paypal import paypal_client
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the worker threadpool that runs the sync (def) endpoints; close the PayPal connection pool on shutdown"""
+    # DB access goes through the sync PyMySQL driver, so endpoints stay `def` and FastAPI
+    # runs them in this threadpool; its size caps how many requests are served at once
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("THREADPOOL_SIZE", limiter.total_tokens))
+    yield
+    paypal_client.close()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Personal Trainer API",
     description="Personal trainer management system with PayPal payments",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     openapi_tags=[
         {"name": "Users", "description": "User management and authentication"},
         {"name": "Bookings", "description": "Session booking management"},
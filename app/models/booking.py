@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -22,3 +22,7 @@ class Booking(Base):
     client = relationship("User", foreign_keys=[client_id])
     coach = relationship("User", foreign_keys=[coach_id])
     slot = relationship("ScheduleSlot", back_populates="bookings")
+
+# A client's bookings by status in date order (workout-cycle position); InnoDB
+# appends the primary key, so (date, id) range scans stay inside the index
+Index('idx_bookings_client_status_date', Booking.client_id, Booking.status, Booking.date)
@@ -60,4 +60,8 @@ Index('idx_payments_client_id', Payment.client_id)
 Index('idx_payments_status', Payment.status)
 Index('idx_payments_paid_at', Payment.paid_at)
 Index('idx_payments_active_until', Payment.active_until)
-Index('idx_payments_plan_id', Payment.plan_id)
\ No newline at end of file
+Index('idx_payments_plan_id', Payment.plan_id)
+# Latest paid payment per client (filter on client/status, ordered by paid_at)
+Index('idx_payments_client_status_paid_at', Payment.client_id, Payment.status, Payment.paid_at.desc())
+# Active memberships (status = PAID and active_until in the future)
+Index('idx_payments_status_active_until', Payment.status, Payment.active_until)
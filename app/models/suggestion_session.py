@@ -1,11 +1,10 @@
 # models/suggestion_session.py
 # Temporary storage for AI suggestions
 
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, Text, Boolean, String
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, String, JSON
 from sqlalchemy.orm import relationship
 from database import Base
 from sqlalchemy.sql import func
-import json
 
 class SuggestionSession(Base):
     """Stores AI suggestions temporarily for re-suggestion and booking"""
@@ -21,10 +20,10 @@ class SuggestionSession(Base):
     num_sessions = Column(Integer, nullable=False)
     
     # Suggestions as JSON
-    suggestions_json = Column(Text, nullable=False)  # JSON array of suggestions
+    suggestions_json = Column(JSON, nullable=False)  # JSON array of suggestions
     
     # Track all previously suggested slots to avoid cycling
-    all_suggested_slots_json = Column(Text, nullable=True)  # JSON array of all slot IDs ever suggested
+    all_suggested_slots_json = Column(JSON, nullable=True)  # JSON array of all slot IDs ever suggested
     
     # Status tracking
     is_active = Column(Boolean, default=True)
@@ -35,33 +34,24 @@ class SuggestionSession(Base):
     client = relationship("User", foreign_keys=[client_id])
     
     def get_suggestions(self):
-        """Parse suggestions from JSON"""
-        return json.loads(str(self.suggestions_json))
+        """Get suggestions (decoded by the JSON column)"""
+        return self.suggestions_json or []
     
     def set_suggestions(self, suggestions):
-        """Store suggestions as JSON"""
-        self.suggestions_json = json.dumps(suggestions)
+        """Store suggestions in the JSON column"""
+        self.suggestions_json = suggestions
     
-    def add_to_suggested_history(self, new_slot_ids):
-        """Add slot IDs to the history of all suggested slots"""
-        try:
-            existing_slots = json.loads(str(self.all_suggested_slots_json)) if self.all_suggested_slots_json else []
-        except (json.JSONDecodeError, TypeError):
-            existing_slots = []
-        
-        # Add new slot IDs to the list, avoiding duplicates
-        for slot_id in new_slot_ids:
-            if slot_id not in existing_slots:
-                existing_slots.append(slot_id)
-        
-        self.all_suggested_slots_json = json.dumps(existing_slots)
+    def find_suggestion(self, slot_id):
+        """Return (position, suggestion) for a slot ID, or (None, None) if not suggested"""
+        for position, suggestion in enumerate(self.get_suggestions()):
+            if suggestion.get('slot_id') == slot_id:
+                return position, suggestion
+        return None, None
     
     def get_all_suggested_slots(self):
         """Get all slot IDs that have been suggested in this session"""
-        try:
-            return json.loads(str(self.all_suggested_slots_json)) if self.all_suggested_slots_json else []
-        except (json.JSONDecodeError, TypeError):
-            return []
+        # History is appended server-side, so drop any repeats while keeping order
+        return list(dict.fromkeys(self.all_suggested_slots_json or []))
         
     def __repr__(self):
         return f"<SuggestionSession {self.session_token} for client {self.client_id}>"
\ No newline at end of file
@@ -1,6 +1,6 @@
 # models/user.py
 
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Table
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Table, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -33,7 +33,7 @@ class User(Base):
     phone = Column(String(20), nullable=True)
     plan = Column(String(50), nullable=True)  # Plan assigned to client (e.g., "ABC", "AB")
     avatar = Column(String(255), nullable=True)  # Profile picture URL or path
-    time_preferences = Column(String(500), nullable=True)  # JSON string for time preferences
+    time_preferences = Column(JSON, nullable=True)  # {preferred_start_time, preferred_end_time, preferred_days}
     
     # Coach shift hours for scheduling (NULL for non-coaches)
     shift_start_hour = Column(Integer, nullable=True)  # 10-21, e.g., 10 for 10:00 AM
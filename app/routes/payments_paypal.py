@@ -4,7 +4,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from decimal import Decimal
 import csv
 from io import StringIO
@@ -17,7 +17,7 @@ from app.models.user import User
 from app.schemas.payment import CreateCheckout, CheckoutResponse, PaymentOut, PaymentStatusManual, ManualPaymentCreate
 from app.crud import payment as payment_crud
 from app.auth.permissions import require_client_role, require_accountant_role, get_current_user_dependency
-from app.services.subscriptions import get_plan, has_active_subscription
+from app.services.subscriptions import get_plan, has_active_subscription, subscription_active_until
 from app.integrations.paypal import paypal_client
 
 router = APIRouter()
@@ -104,7 +104,8 @@ async def get_my_payments(
         limit=limit,
         offset=offset
     )
-    return [PaymentOut.from_payment(p) for p in payments]
+    now = datetime.now(timezone.utc)
+    return [PaymentOut.from_payment(p, now=now) for p in payments]
 
 @router.get("/reports", response_model=List[PaymentOut])
 async def get_payment_reports(
@@ -133,7 +134,8 @@ async def get_payment_reports(
         limit=limit,
         offset=offset
     )
-    return [PaymentOut.from_payment(p) for p in payments]
+    now = datetime.now(timezone.utc)
+    return [PaymentOut.from_payment(p, now=now) for p in payments]
 
 @router.get("/all", response_model=List[PaymentOut])
 async def get_all_payments_route(
@@ -148,7 +150,8 @@ async def get_all_payments_route(
         limit=limit,
         offset=offset
     )
-    return [PaymentOut.from_payment(p) for p in payments]
+    now = datetime.now(timezone.utc)
+    return [PaymentOut.from_payment(p, now=now) for p in payments]
 
 @router.get("/{payment_id}", response_model=PaymentOut)
 async def get_payment(
@@ -196,7 +199,7 @@ async def update_payment_status(
     if status_data.status == "PAID" and not status_data.active_until:
         if not payment.paid_at:
             payment.paid_at = datetime.now(timezone.utc)
-        payment.active_until = payment.paid_at + timedelta(days=payment.duration_months * 30)
+        payment.active_until = subscription_active_until(payment.paid_at, payment.duration_months)
     
     db.commit()
     db.refresh(payment)
@@ -232,7 +235,7 @@ async def create_manual_payment(
     # Update status and timing if specified
     if payment_data.status == "PAID":
         paid_at = payment_data.paid_at or datetime.now(timezone.utc)
-        active_until = paid_at + timedelta(days=payment_data.duration_months * 30)
+        active_until = subscription_active_until(paid_at, payment_data.duration_months)
         
         payment_crud.update_payment_status(
             db=db,
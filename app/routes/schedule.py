@@ -4,20 +4,29 @@ Provides endpoints for schedule slots, client plans, preferences, and AI booking
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import and_, text
+from typing import List, Optional, Tuple
 from datetime import date, datetime, timedelta
+import logging
+import uuid
+import orjson
 
 import database as database
-from app.crud import schedule as schedule_crud, user as user_crud
+from app.crud import schedule as schedule_crud, user as user_crud, suggestion_session as session_crud
 from app.schemas import schedule as schedule_schemas
-from app.schemas.ai_booking import SelectiveBookingRequest, ReSuggestionRequest, SuggestionResponse, SessionBasedBookingRequest, IndividualReSuggestionRequest
-from app.auth.permissions import require_coach_role, require_accountant_role, get_current_user_import
+from app.schemas.ai_booking import SelectiveBookingRequest, ReSuggestionRequest, SuggestionResponse, SessionBasedBookingRequest, IndividualReSuggestionRequest, BOOKING_SUGGESTION_LIST
+from app.auth.permissions import require_coach_role, require_accountant_role, get_current_user_import, get_token_subject_import
 from app.models.user import User, UserRole
-from app.services.scheduler import CPSATScheduler
-from app.models.schedule import PlanType, ClientPreference, PlanRequestStatus
+import app.services.scheduler as scheduler_service
+from app.models.schedule import PlanType, PlanRequestStatus, ScheduleSlot
+from app.models.booking import Booking
+from app.models.suggestion_session import SuggestionSession
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Dependency to get DB session
 def get_db():
@@ -31,6 +40,27 @@ def get_db():
 require_auth = get_current_user_import()
 require_coach = require_coach_role
 require_admin = require_accountant_role
+require_token_subject = get_token_subject_import()
+
+def _conflict(db: Session, detail: str) -> HTTPException:
+    """End the read-only validation transaction and build a 409 response"""
+    # Nothing was written, so committing just hands the connection back to the pool
+    db.commit()
+    return HTTPException(status_code=409, detail=detail)
+
+# Decisions a coach can make on a plan request, resolved once to enum members
+_PLAN_REQUEST_DECISIONS = {
+    "APPROVED": PlanRequestStatus.APPROVED,
+    "REJECTED": PlanRequestStatus.REJECTED
+}
+
+# Plan type names accepted when a coach approves a plan request
+_PLAN_TYPE_MAP = {
+    "AB": PlanType.AB,
+    "ABC": PlanType.ABC,
+    "PPL": PlanType.PPL,
+    "FIVE_DAY": PlanType.FIVE_DAY
+}
 
 # ============================================================================
 # SCHEDULE SLOTS ENDPOINTS
@@ -69,7 +99,7 @@ def get_available_slots_for_client(
     """Get available slots for a specific client based on their plan and preferences."""
     
     # Authorization check - clients can only see their own availability
-    if getattr(current_user, 'role') != UserRole.COACH and getattr(current_user, 'id') != client_id:
+    if current_user.role != UserRole.COACH and current_user.id != client_id:
         raise HTTPException(
             status_code=403, 
             detail="Access denied: You can only view your own available slots"
@@ -79,13 +109,13 @@ def get_available_slots_for_client(
     target_date = date_from or date.today()
     week_start = datetime.combine(target_date, datetime.min.time())
     
-    slots = schedule_crud.get_available_slots_for_client(
+    slot_rows = schedule_crud.get_available_slots_with_occupancy(
         db,
         client_id=client_id,
         week_start=week_start
     )
     
-    return slots
+    return [schedule_schemas.ScheduleSlotOut.from_row(slot, occupancy) for slot, occupancy in slot_rows]
 
 
 @router.get("/slots/{slot_id}", response_model=schedule_schemas.ScheduleSlotOut)
@@ -120,17 +150,17 @@ def get_client_plans(
     """Get client plans with optional filtering."""
     
     # Handle "me" parameter for current user
-    if client_id == "me" or getattr(current_user, 'role') == UserRole.CLIENT:
+    if client_id == "me" or current_user.role == UserRole.CLIENT:
         # Force client to see only their own plans
-        actual_client_id = getattr(current_user, 'id')
+        actual_client_id = current_user.id
         plan = schedule_crud.get_client_plan(db, actual_client_id)
         if plan:
             # Add coach information
-            coach = user_crud.get_user_by_id(db, getattr(plan, 'assigned_coach_id'))
+            coach = user_crud.get_user_by_id(db, plan.assigned_coach_id)
             plan_dict = {
                 **plan.__dict__,
-                'coach_name': f"{getattr(coach, 'first_name', '')} {getattr(coach, 'last_name', '')}".strip() if coach else None,
-                'coach_username': getattr(coach, 'username', None) if coach else None
+                'coach_name': f"{coach.first_name} {coach.last_name}".strip() if coach else None,
+                'coach_username': coach.username if coach else None
             }
             return [schedule_schemas.ClientPlanOut(**plan_dict)]
         return []
@@ -138,7 +168,7 @@ def get_client_plans(
         # Handle numeric client_id
         actual_client_id = int(client_id)
         # Authorization check for accessing other user's plans
-        if getattr(current_user, 'role') == UserRole.CLIENT and actual_client_id != getattr(current_user, 'id'):
+        if current_user.role == UserRole.CLIENT and actual_client_id != current_user.id:
             raise HTTPException(
                 status_code=403,
                 detail="You can only view your own plan"
@@ -146,17 +176,17 @@ def get_client_plans(
         plan = schedule_crud.get_client_plan(db, actual_client_id)
         if plan:
             # Add coach information
-            coach = user_crud.get_user_by_id(db, getattr(plan, 'assigned_coach_id'))
+            coach = user_crud.get_user_by_id(db, plan.assigned_coach_id)
             plan_dict = {
                 **plan.__dict__,
-                'coach_name': f"{getattr(coach, 'first_name', '')} {getattr(coach, 'last_name', '')}".strip() if coach else None,
-                'coach_username': getattr(coach, 'username', None) if coach else None
+                'coach_name': f"{coach.first_name} {coach.last_name}".strip() if coach else None,
+                'coach_username': coach.username if coach else None
             }
             return [schedule_schemas.ClientPlanOut(**plan_dict)]
         return []
     elif coach_id:
         # Only coaches can filter by coach_id
-        if getattr(current_user, 'role') != UserRole.COACH:
+        if current_user.role != UserRole.COACH:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: Only coaches can view plans by coach"
@@ -165,7 +195,7 @@ def get_client_plans(
         return plans
     else:
         # Only coaches can see all plans
-        if getattr(current_user, 'role') != UserRole.COACH:
+        if current_user.role != UserRole.COACH:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: Only coaches can view all plans"
@@ -184,7 +214,7 @@ def create_client_plan(
     db_plan = schedule_crud.create_client_plan(
         db, 
         client_id=plan.client_id,
-        plan_type=PlanType(plan.plan_type.value),  # Convert enum properly
+        plan_type=PlanType[plan.plan_type.name],  # Schema and model enums share member names
         assigned_coach_id=plan.assigned_coach_id
     )
     return db_plan
@@ -230,13 +260,13 @@ def create_plan_request(
     """Create a plan request from client to coach."""
     
     # Authorization: Only clients can create plan requests for themselves
-    if getattr(current_user, 'role') != UserRole.CLIENT:
+    if current_user.role != UserRole.CLIENT:
         raise HTTPException(
             status_code=403,
             detail="Only clients can request plans"
         )
     
-    if request.client_id != getattr(current_user, 'id'):
+    if request.client_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="You can only request plans for yourself"
@@ -244,7 +274,7 @@ def create_plan_request(
     
     # Verify coach exists and is actually a coach
     coach = user_crud.get_user_by_id(db, request.coach_id)
-    if not coach or getattr(coach, 'role') != UserRole.COACH:
+    if not coach or coach.role != UserRole.COACH:
         raise HTTPException(
             status_code=400,
             detail="Invalid coach ID"
@@ -253,24 +283,13 @@ def create_plan_request(
     # Check if client already has a plan
     existing_plan = schedule_crud.get_client_plan(db, request.client_id)
     if existing_plan:
-        raise HTTPException(
-            status_code=400,
-            detail="You already have a plan assigned. Contact your coach to modify it."
-        )
+        raise _conflict(db, "You already have a plan assigned. Contact your coach to modify it.")
     
     # Check for existing pending request
-    from app.models.schedule import PlanRequest
-    existing_request = db.query(PlanRequest).filter(
-        PlanRequest.client_id == request.client_id,
-        PlanRequest.coach_id == request.coach_id,
-        PlanRequest.status == PlanRequestStatus.PENDING
-    ).first()
+    existing_request = schedule_crud.get_pending_plan_request(db, request.client_id, request.coach_id)
     
     if existing_request:
-        raise HTTPException(
-            status_code=400,
-            detail="You already have a pending plan request with this coach. Please wait for a response."
-        )
+        raise _conflict(db, "You already have a pending plan request with this coach. Please wait for a response.")
     
     plan_request = schedule_crud.create_plan_request(
         db,
@@ -288,17 +307,19 @@ def get_my_plan_requests(
 ):
     """Get plan requests for current user (client sees their requests, coach sees requests to them)."""
     
-    if getattr(current_user, 'role') == UserRole.CLIENT:
-        requests = schedule_crud.get_plan_requests_for_client(db, getattr(current_user, 'id'))
-    elif getattr(current_user, 'role') == UserRole.COACH:
-        requests = schedule_crud.get_plan_requests_for_coach(db, getattr(current_user, 'id'))
+    if current_user.role == UserRole.CLIENT:
+        requests = schedule_crud.get_plan_request_rows(db, client_id=current_user.id)
+    elif current_user.role == UserRole.COACH:
+        requests = schedule_crud.get_plan_request_rows(db, coach_id=current_user.id)
     else:
         raise HTTPException(
             status_code=403,
             detail="Only clients and coaches can view plan requests"
         )
     
-    return requests
+    # Rows come straight from the table, so skip re-validating them through the
+    # response model (which is still used for the OpenAPI docs)
+    return ORJSONResponse(requests)
 
 @router.get("/plan-requests/pending", response_model=List[schedule_schemas.PlanRequestOut])
 def get_pending_plan_requests(
@@ -309,7 +330,7 @@ def get_pending_plan_requests(
     
     requests = schedule_crud.get_plan_requests_for_coach(
         db, 
-        getattr(current_user, 'id'), 
+        current_user.id, 
         status="PENDING"
     )
     
@@ -325,8 +346,7 @@ def update_plan_request(
     """Approve or reject a plan request (coaches only)."""
     
     # Get the request first
-    from app.models.schedule import PlanRequest
-    plan_request = db.query(PlanRequest).filter(PlanRequest.id == request_id).first()
+    plan_request = schedule_crud.get_plan_request_by_id(db, request_id)
     
     if not plan_request:
         raise HTTPException(
@@ -335,63 +355,48 @@ def update_plan_request(
         )
     
     # Verify this coach owns the request
-    if plan_request.coach_id != getattr(current_user, 'id'):
+    if plan_request.coach_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="You can only respond to plan requests sent to you"
         )
     
     # Verify status is valid
-    if update_data.status not in ["APPROVED", "REJECTED"]:
+    decision = _PLAN_REQUEST_DECISIONS.get(update_data.status)
+    if decision is None:
         raise HTTPException(
             status_code=400,
             detail="Status must be APPROVED or REJECTED"
         )
     
-    # Update the request
-    updated_request = schedule_crud.update_plan_request(
-        db,
-        request_id=request_id,
-        status=update_data.status,
-        response_message=update_data.response_message
-    )
-    
-    # If approved, create a plan for the client
-    if update_data.status == "APPROVED":
+    # If approved, update the request and create the client's plan together
+    if decision is PlanRequestStatus.APPROVED:
+        # Use the chosen plan type or default to ABC
+        chosen_plan_type = _PLAN_TYPE_MAP.get(
+            update_data.plan_type or "ABC", 
+            PlanType.ABC
+        )
+        
         try:
-            # Use the chosen plan type or default to ABC
-            from app.models.schedule import PlanType
-            
-            plan_type_mapping = {
-                "AB": PlanType.AB,
-                "ABC": PlanType.ABC,
-                "PPL": PlanType.PPL,
-                "FIVE_DAY": PlanType.FIVE_DAY
-            }
-            
-            chosen_plan_type = plan_type_mapping.get(
-                update_data.plan_type or "ABC", 
-                PlanType.ABC
-            )
-            
-            schedule_crud.create_client_plan(
+            updated_request = schedule_crud.approve_plan_request(
                 db,
-                client_id=getattr(plan_request, 'client_id'),
+                plan_request,
                 plan_type=chosen_plan_type,
-                assigned_coach_id=getattr(plan_request, 'coach_id')
-            )
-        except Exception as e:
-            # If plan creation fails, update request status back
-            schedule_crud.update_plan_request(
-                db,
-                request_id=request_id,
-                status="PENDING",
-                response_message="Error creating plan. Please try again."
+                response_message=update_data.response_message
             )
+        except Exception:
+            # The savepoint rolled back both the status change and the plan
             raise HTTPException(
                 status_code=500,
                 detail="Failed to create plan after approval"
             )
+    else:
+        updated_request = schedule_crud.update_plan_request(
+            db,
+            request_id=request_id,
+            status=decision,
+            response_message=update_data.response_message
+        )
     
     return updated_request
 
@@ -399,6 +404,18 @@ def update_plan_request(
 # CLIENT PREFERENCES ENDPOINTS
 # ============================================================================
 
+def _stream_all_preferences():
+    """Yield all client preferences as a JSON array, one batch of rows at a time"""
+    # Dependencies are torn down before a streamed body is sent, so use a dedicated session
+    db = database.SessionLocal()
+    try:
+        yield b"["
+        for index, row in enumerate(schedule_crud.iter_client_preference_rows(db)):
+            yield (b"," if index else b"") + orjson.dumps(row)
+        yield b"]"
+    finally:
+        db.close()
+
 @router.get("/preferences", response_model=List[schedule_schemas.ClientPreferenceOut])
 def get_client_preferences(
     client_id: Optional[int] = Query(None, description="Filter by client ID"),
@@ -408,22 +425,23 @@ def get_client_preferences(
     """Get client preferences with optional filtering."""
     
     # Authorization: Clients can only see their own preferences, coaches can see all
-    if getattr(current_user, 'role') == UserRole.CLIENT:
+    if current_user.role == UserRole.CLIENT:
         # Force client to see only their own preferences
-        client_id = getattr(current_user, 'id')
+        client_id = current_user.id
     
     if client_id:
-        preference = schedule_crud.get_client_preference(db, client_id)
+        # Read-only path: serialize the row directly without loading an ORM object
+        preference = schedule_crud.get_client_preference_row(db, client_id)
         return [preference] if preference else []
     else:
         # Only coaches can see all preferences
-        if getattr(current_user, 'role') != UserRole.COACH:
+        if current_user.role != UserRole.COACH:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: Only coaches can view all preferences"
             )
-        preferences = schedule_crud.get_all_client_preferences(db)
-        return preferences
+        # Stream the (potentially large) list instead of materializing it in memory
+        return StreamingResponse(_stream_all_preferences(), media_type="application/json")
 
 @router.post("/preferences", response_model=schedule_schemas.ClientPreferenceOut)
 def create_client_preference(
@@ -434,24 +452,24 @@ def create_client_preference(
     """Create a new client preference."""
     
     # Authorization: Clients can only create their own preferences, coaches can create for any client
-    if getattr(current_user, 'role') == UserRole.CLIENT:
-        if preference.client_id != getattr(current_user, 'id'):
+    if current_user.role == UserRole.CLIENT:
+        if preference.client_id != current_user.id:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: You can only create preferences for yourself"
             )
     
     # Check if user exists and is a client
-    client = db.query(User).filter(User.id == preference.client_id).first()
-    if not client:
+    client_exists = db.query(User.id).filter(User.id == preference.client_id).scalar() is not None
+    if not client_exists:
         raise HTTPException(status_code=404, detail="Client not found")
     
     # Check if preference already exists
     existing_preference = schedule_crud.get_client_preference(db, preference.client_id)
     if existing_preference:
-        raise HTTPException(
-            status_code=409, 
-            detail=f"Client {preference.client_id} already has preferences. Use PUT to update existing preferences."
+        raise _conflict(
+            db,
+            f"Client {preference.client_id} already has preferences. Use PUT to update existing preferences."
         )
     
     # Create the preference
@@ -475,21 +493,19 @@ def update_client_preference(
     """Update an existing client preference."""
     
     # Get the existing preference
-    from app.models.schedule import ClientPreference
-    existing_preference = db.query(ClientPreference).filter(ClientPreference.id == preference_id).first()
+    existing_preference = schedule_crud.get_client_preference_by_id(db, preference_id)
     if not existing_preference:
         raise HTTPException(status_code=404, detail="Preference not found")
     
     # Authorization: Clients can only update their own preferences, coaches can update any  
-    if getattr(current_user, 'role') == UserRole.CLIENT:
-        if existing_preference.client_id != getattr(current_user, 'id'):
+    if current_user.role == UserRole.CLIENT:
+        if existing_preference.client_id != current_user.id:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: You can only update your own preferences"
             )
     
     # Update using raw SQL to avoid typing issues
-    from sqlalchemy import text
     update_query = text("""
         UPDATE client_preferences 
         SET preferred_start_hour = COALESCE(:start_hour, preferred_start_hour),
@@ -507,7 +523,7 @@ def update_client_preference(
     db.commit()
     
     # Return the updated preference
-    updated_preference = db.query(ClientPreference).filter(ClientPreference.id == preference_id).first()
+    updated_preference = schedule_crud.get_client_preference_by_id(db, preference_id)
     return updated_preference
 
 @router.delete("/preferences/{preference_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -519,14 +535,13 @@ def delete_client_preference(
     """Delete a client preference."""
     
     # Get the existing preference
-    from app.models.schedule import ClientPreference
-    existing_preference = db.query(ClientPreference).filter(ClientPreference.id == preference_id).first()
+    existing_preference = schedule_crud.get_client_preference_by_id(db, preference_id)
     if not existing_preference:
         raise HTTPException(status_code=404, detail="Preference not found")
     
     # Authorization: Clients can only delete their own preferences, coaches can delete any
-    if getattr(current_user, 'role') == UserRole.CLIENT:
-        if existing_preference.client_id != getattr(current_user, 'id'):
+    if current_user.role == UserRole.CLIENT:
+        if existing_preference.client_id != current_user.id:
             raise HTTPException(
                 status_code=403,
                 detail="Access denied: You can only delete your own preferences"
@@ -599,13 +614,9 @@ def suggest_optimal_booking(
     Session expires in 1 hour to maintain suggestion consistency.
     """
     
-    import uuid
-    from datetime import timedelta
-    from app.models.suggestion_session import SuggestionSession
-    
     try:
         # Initialize CP-SAT scheduler
-        scheduler = CPSATScheduler(db)
+        scheduler = scheduler_service.CPSATScheduler(db)
         
         # Convert date to datetime for solver
         preferred_datetime = None
@@ -650,7 +661,7 @@ def suggest_optimal_booking(
         elif scheduling_result.total_suggestions == 0:
             message = "No available suggestions found"
         
-        return SuggestionResponse(
+        response = SuggestionResponse(
             message=message,
             algorithm="CP-SAT (Constraint Programming Satisfiability)",
             suggestions=scheduling_result.suggested_slots,
@@ -662,6 +673,8 @@ def suggest_optimal_booking(
             session_token=session_token,
             expires_at=expires_at.isoformat()
         )
+        # Serialize straight to JSON; re-validating against response_model would only repeat this work
+        return Response(response.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI scheduling failed: {str(e)}")
@@ -705,53 +718,31 @@ def book_selected_suggestions(
     Validates each suggestion is still available before booking.
     """
     
-    from app.models.booking import Booking
-    from app.models.schedule import ScheduleSlot
-    from app.models.suggestion_session import SuggestionSession
-    from datetime import datetime
-    from sqlalchemy import and_
-    import json
-    
-    # Debug: Log the incoming session token
-    print(f"🔍 DEBUG: Looking for session token: {booking_request.session_token}")
-    print(f"🔍 DEBUG: Current user ID: {getattr(current_user, 'id', 'N/A')}")
-    
-    # Debug: Check what sessions exist in the database
-    all_sessions = db.query(SuggestionSession).filter(SuggestionSession.is_active == True).all()
-    print(f"🔍 DEBUG: Found {len(all_sessions)} active sessions in database:")
-    for s in all_sessions:
-        print(f"  - Token: {s.session_token}, Client: {s.client_id}, Expires: {s.expires_at}")
-    
-    # Get the session using the token
-    session = db.query(SuggestionSession).filter(
-        SuggestionSession.session_token == booking_request.session_token,
-        SuggestionSession.is_active == True
-    ).first()
+    logger.debug("Booking from session %s for user %s", booking_request.session_token, current_user.id)
+    
+    # Get the session using the token (only the columns booking needs)
+    session = session_crud.get_session_snapshot(db, booking_request.session_token)
     
     if not session:
-        print(f"❌ DEBUG: Session not found for token: {booking_request.session_token}")
+        logger.debug("Session not found for token %s", booking_request.session_token)
         raise HTTPException(status_code=404, detail="Session not found or expired")
     
     # Check if session belongs to current user
-    if getattr(current_user, 'role') == UserRole.CLIENT and session.client_id != getattr(current_user, 'id'):
+    if current_user.role == UserRole.CLIENT and session['client_id'] != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied: Session belongs to another user")
     
     # Check if session is expired
     current_time = datetime.utcnow()
-    expires_at = getattr(session, 'expires_at')
+    expires_at = session['expires_at']
     if current_time > expires_at:
         raise HTTPException(status_code=410, detail="Session has expired")
     
-    # Parse the suggestions from the session
-    try:
-        suggestions_json = getattr(session, 'suggestions_json')
-        suggestions = json.loads(str(suggestions_json))
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Invalid session data")
+    # Get the suggestions from the session
+    suggestions = session['suggestions']
     
     # Validate that requested slot IDs exist in the session
-    session_slot_ids = [sugg.get('slot_id') for sugg in suggestions]
-    invalid_slots = [sid for sid in booking_request.selected_slot_ids if sid not in session_slot_ids]
+    suggestions_by_slot = {sugg.get('slot_id'): sugg for sugg in suggestions}
+    invalid_slots = [sid for sid in booking_request.selected_slot_ids if sid not in suggestions_by_slot]
     if invalid_slots:
         raise HTTPException(
             status_code=400, 
@@ -760,11 +751,68 @@ def book_selected_suggestions(
     
     successful_bookings = []
     failed_bookings = []
+    pending_bookings = []
     
     try:
-        for slot_id in booking_request.selected_slot_ids:
+        selected_ids = booking_request.selected_slot_ids
+        active_statuses = ["pending", "confirmed"]
+        
+        # Lock the client's row so concurrent bookings for the same client run one at a time;
+        # the checks below and the inserts then happen atomically (released on commit/rollback)
+        db.query(User.id).filter(User.id == session['client_id']).with_for_update().first()
+        
+        # Prefetch everything the per-slot checks need in three queries instead of 3 per slot
+        # Lock the selected slots; slots another booking holds are skipped instead of waited on
+        existing_slot_ids = {
+            row[0] for row in db.query(ScheduleSlot.id)
+            .filter(ScheduleSlot.id.in_(selected_ids))
+            .with_for_update(skip_locked=True)
+        }
+        locked_slot_ids = set()
+        missing_slot_ids = set(selected_ids) - existing_slot_ids
+        if missing_slot_ids:
+            # Slots that exist but were skipped are locked by a concurrent booking
+            locked_slot_ids = {
+                row[0] for row in db.query(ScheduleSlot.id).filter(ScheduleSlot.id.in_(missing_slot_ids))
+            }
+        booked_slot_times = {
+            (row[0], row[1]) for row in db.query(Booking.slot_id, Booking.date).filter(
+                Booking.slot_id.in_(selected_ids),
+                Booking.status.in_(active_statuses)
+            )
+        }
+        
+        # Parse each distinct suggestion date once; the booking loop reuses these
+        parsed_dates = {}
+        for slot_id in selected_ids:
+            date_str = suggestions_by_slot.get(slot_id, {}).get('date_suggestion')
+            if date_str in parsed_dates:
+                continue
+            try:
+                parsed_dates[date_str] = datetime.fromisoformat(date_str)
+            except (TypeError, ValueError):
+                continue
+        candidate_days = [parsed.date() for parsed in parsed_dates.values()]
+        
+        # One range query covers every day touched by the selection (computed once, not per slot)
+        client_booked_days = set()
+        if candidate_days:
+            range_start = min(candidate_days)
+            range_end = max(candidate_days) + timedelta(days=1)
+            client_booked_days = {
+                row[0].date() for row in db.query(Booking.date).filter(
+                    and_(
+                        Booking.client_id == session['client_id'],
+                        Booking.date >= range_start,
+                        Booking.date < range_end,
+                        Booking.status.in_(active_statuses)
+                    )
+                )
+            }
+        
+        for slot_id in selected_ids:
             # Find the suggestion for this slot
-            suggestion = next((s for s in suggestions if s.get('slot_id') == slot_id), None)
+            suggestion = suggestions_by_slot.get(slot_id)
             if not suggestion:
                 failed_bookings.append({
                     "slot_id": slot_id,
@@ -785,12 +833,19 @@ def book_selected_suggestions(
                     continue
                     
                 # Parse the date and add the hour
-                booking_date = datetime.fromisoformat(date_str)
+                booking_date = parsed_dates.get(date_str) or datetime.fromisoformat(date_str)
                 booking_datetime = booking_date.replace(hour=hour, minute=0, second=0, microsecond=0)
+                booking_day = booking_datetime.date()
                 
                 # Validate slot still exists and is available
-                slot = db.query(ScheduleSlot).filter(ScheduleSlot.id == slot_id).first()
-                if not slot:
+                if slot_id in locked_slot_ids:
+                    failed_bookings.append({
+                        "slot_id": slot_id,
+                        "reason": "Slot temporarily unavailable"
+                    })
+                    continue
+                
+                if slot_id not in existing_slot_ids:
                     failed_bookings.append({
                         "slot_id": slot_id,
                         "reason": "Slot no longer exists"
@@ -798,13 +853,7 @@ def book_selected_suggestions(
                     continue
                 
                 # Check for existing booking on this slot
-                existing_booking = db.query(Booking).filter(
-                    Booking.slot_id == slot_id,
-                    Booking.date == booking_datetime,
-                    Booking.status.in_(["pending", "confirmed"])
-                ).first()
-                
-                if existing_booking:
+                if (slot_id, booking_datetime) in booked_slot_times:
                     failed_bookings.append({
                         "slot_id": slot_id,
                         "reason": "Slot already booked"
@@ -812,25 +861,16 @@ def book_selected_suggestions(
                     continue
                 
                 # Check for client double-booking on same day
-                same_day_booking = db.query(Booking).filter(
-                    and_(
-                        Booking.client_id == session.client_id,
-                        Booking.date >= booking_datetime.date(),
-                        Booking.date < booking_datetime.date() + timedelta(days=1),
-                        Booking.status.in_(["pending", "confirmed"])
-                    )
-                ).first()
-                
-                if same_day_booking:
+                if booking_day in client_booked_days:
                     failed_bookings.append({
                         "slot_id": slot_id,
                         "reason": "Client already has booking on this day"
                     })
                     continue
                 
-                # Create the booking
-                new_booking = Booking(
-                    client_id=session.client_id,
+                # Queue the booking; rows are inserted together after validation
+                booking_fields = dict(
+                    client_id=session['client_id'],
                     coach_id=suggestion['coach_id'],
                     slot_id=slot_id,
                     date=booking_datetime,
@@ -838,21 +878,11 @@ def book_selected_suggestions(
                     ai_generated=True  # Mark as AI-generated
                 )
                 
-                db.add(new_booking)
-                db.flush()  # Get the ID without committing
+                # Keep the prefetched sets in sync with bookings made in this request
+                booked_slot_times.add((slot_id, booking_datetime))
+                client_booked_days.add(booking_day)
                 
-                successful_bookings.append({
-                    "booking_id": new_booking.id,
-                    "client_id": new_booking.client_id,
-                    "coach_id": new_booking.coach_id,
-                    "slot_id": new_booking.slot_id,
-                    "datetime": booking_datetime.isoformat(),
-                    "date": suggestion['date_suggestion'],
-                    "hour": suggestion['hour'],
-                    "coach_name": suggestion.get('coach_name', 'Unknown'),
-                    "status": new_booking.status,
-                    "ai_generated": new_booking.ai_generated
-                })
+                pending_bookings.append((booking_fields, suggestion, booking_datetime))
                 
             except Exception as e:
                 failed_bookings.append({
@@ -860,6 +890,48 @@ def book_selected_suggestions(
                     "reason": f"Booking error: {str(e)}"
                 })
         
+        # Insert all new bookings in a single flush (inside a SAVEPOINT) to get their IDs
+        created_bookings = []
+        if pending_bookings:
+            try:
+                with db.begin_nested():
+                    batch = [Booking(**fields) for fields, _, _ in pending_bookings]
+                    db.add_all(batch)
+                    db.flush()
+                created_bookings = [
+                    (new_booking, suggestion, booking_datetime)
+                    for new_booking, (_, suggestion, booking_datetime) in zip(batch, pending_bookings)
+                ]
+            except Exception:
+                # Retry slot by slot, each in its own SAVEPOINT, so one bad row
+                # doesn't discard the bookings that can still be made
+                for fields, suggestion, booking_datetime in pending_bookings:
+                    try:
+                        with db.begin_nested():
+                            new_booking = Booking(**fields)
+                            db.add(new_booking)
+                            db.flush()
+                        created_bookings.append((new_booking, suggestion, booking_datetime))
+                    except Exception as e:
+                        failed_bookings.append({
+                            "slot_id": fields['slot_id'],
+                            "reason": f"Booking error: {str(e)}"
+                        })
+        
+        for new_booking, suggestion, booking_datetime in created_bookings:
+            successful_bookings.append({
+                "booking_id": new_booking.id,
+                "client_id": new_booking.client_id,
+                "coach_id": new_booking.coach_id,
+                "slot_id": new_booking.slot_id,
+                "datetime": booking_datetime.isoformat(),
+                "date": suggestion['date_suggestion'],
+                "hour": suggestion['hour'],
+                "coach_name": suggestion.get('coach_name', 'Unknown'),
+                "status": new_booking.status,
+                "ai_generated": new_booking.ai_generated
+            })
+        
         # Commit all successful bookings
         if successful_bookings:
             db.commit()
@@ -898,16 +970,16 @@ def re_suggest_alternatives(
     
     try:
         # Initialize CP-SAT scheduler
-        scheduler = CPSATScheduler(db)
+        scheduler = scheduler_service.CPSATScheduler(db)
         
         # Convert kept suggestions to exclude them from new search
         excluded_slots = [sugg.slot_id for sugg in re_suggestion_request.keep_suggestions]
-        excluded_dates = [sugg.date_suggestion for sugg in re_suggestion_request.keep_suggestions]
+        excluded_dates = {sugg.date_suggestion for sugg in re_suggestion_request.keep_suggestions}
         
         # Convert preferred date
         preferred_datetime = None
         if re_suggestion_request.preferred_date:
-            preferred_datetime = datetime.strptime(re_suggestion_request.preferred_date, "%Y-%m-%d")
+            preferred_datetime = datetime.fromisoformat(re_suggestion_request.preferred_date)
         
         # Get new suggestions (note: excluded_slot_ids parameter needs to be added to scheduler)
         scheduling_result = scheduler.suggest_optimal_bookings(
@@ -929,7 +1001,7 @@ def re_suggest_alternatives(
         
         return {
             "message": "Re-suggestion completed",
-            "kept_suggestions": [sugg.dict() for sugg in re_suggestion_request.keep_suggestions],
+            "kept_suggestions": BOOKING_SUGGESTION_LIST.dump_python(re_suggestion_request.keep_suggestions),
             "new_suggestions": new_suggestions,
             "total_suggestions": len(re_suggestion_request.keep_suggestions) + len(new_suggestions),
             "algorithm": "CP-SAT (Constraint Programming Satisfiability)",
@@ -946,11 +1018,37 @@ def re_suggest_alternatives(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Re-suggestion failed: {str(e)}")
 
+def _load_owned_session(db: Session, session_token: str, email: str) -> Tuple[User, SuggestionSession]:
+    """Authorize the caller and load their active suggestion session in one round trip"""
+    owned = session_crud.get_session_with_owner(db, session_token, email)
+    if owned is None:
+        # Slow path only to report the right error
+        if user_crud.get_user_by_email(db, email) is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        if session_crud.get_active_session(db, session_token) is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    current_user, session = owned
+    
+    # Check expiry
+    if datetime.utcnow() > session.expires_at:
+        raise HTTPException(status_code=410, detail="Session has expired")
+    
+    return current_user, session
+
+def require_session_owner(
+    session_token: str = Query(..., description="Session token"),
+    email: str = Depends(require_token_subject),
+    db: Session = Depends(get_db)
+) -> Tuple[User, SuggestionSession]:
+    """Dependency returning (current_user, session) for a session the caller owns"""
+    return _load_owned_session(db, session_token, email)
+
 @router.get("/suggestions/re-suggest-session")
 def re_suggest_session_based(
-    session_token: str = Query(..., description="Session token"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_auth)
+    owner: Tuple[User, SuggestionSession] = Depends(require_session_owner),
+    db: Session = Depends(get_db)
 ):
     """
     Simple session-based re-suggestion endpoint.
@@ -958,88 +1056,63 @@ def re_suggest_session_based(
     Regenerates suggestions for the same parameters as the original session.
     """
     
-    import json
-    from app.models.suggestion_session import SuggestionSession
+    _, session = owner
+    session_token = session.session_token
     
     try:
-        # Find the session
-        session = db.query(SuggestionSession).filter(
-            SuggestionSession.session_token == session_token,
-            SuggestionSession.is_active == True
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found or expired")
-        
-        # Validate access
-        if getattr(session, 'client_id') != getattr(current_user, 'id'):
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        # Check expiry
-        current_time = datetime.utcnow()
-        if current_time > getattr(session, 'expires_at'):
-            raise HTTPException(status_code=410, detail="Session has expired")
-        
         # Re-run suggestions with original parameters
-        scheduler = CPSATScheduler(db)
+        scheduler = scheduler_service.CPSATScheduler(db)
         
         # Convert preferred date from session
         preferred_datetime = None
-        session_preferred_date = getattr(session, 'preferred_date')
+        session_preferred_date = session.preferred_date
         if session_preferred_date:
-            preferred_datetime = datetime.strptime(session_preferred_date, "%Y-%m-%d")
-        
-        # Get ALL previously suggested slots to avoid cycling
-        excluded_slot_ids = []
+            preferred_datetime = datetime.fromisoformat(session_preferred_date)
         
-        # First, add current suggestions to history
-        current_suggestions_json = getattr(session, 'suggestions_json', None)
-        current_slot_ids = []
-        if current_suggestions_json:
-            try:
-                current_suggestions = json.loads(current_suggestions_json)
-                current_slot_ids = [sugg.get('slot_id') for sugg in current_suggestions if sugg.get('slot_id')]
-                # Add current suggestions to historical tracking
-                session.add_to_suggested_history(current_slot_ids)
-            except (json.JSONDecodeError, AttributeError) as e:
-                print(f"🔍 RE-SUGGESTION DEBUG - Could not parse current suggestions: {e}")
+        # Current suggestions become part of the history as well
+        current_suggestions = session.get_suggestions()
+        current_slot_ids = [sugg.get('slot_id') for sugg in current_suggestions if sugg.get('slot_id')]
         
-        # Get all historically suggested slots to exclude them ALL
-        excluded_slot_ids = session.get_all_suggested_slots()
-        print(f"🔍 RE-SUGGESTION DEBUG - Excluding {len(excluded_slot_ids)} total historical suggestions: {excluded_slot_ids}")
+        # Exclude ALL previously suggested slots (history + current) to avoid cycling
+        history_slot_ids = session.get_all_suggested_slots()
+        excluded_slot_ids = list(dict.fromkeys(history_slot_ids + current_slot_ids))
+        logger.debug("Re-suggestion excluding %d historical suggestions: %s", len(excluded_slot_ids), excluded_slot_ids)
         
         # Generate new suggestions with ALL excluded slots
         scheduling_result = scheduler.suggest_optimal_bookings(
-            client_id=getattr(session, 'client_id'),
-            num_sessions=getattr(session, 'num_sessions'),
+            client_id=session.client_id,
+            num_sessions=session.num_sessions,
             preferred_date=preferred_datetime,
-            days_flexibility=getattr(session, 'days_flexibility'),
+            days_flexibility=session.days_flexibility,
             excluded_slot_ids=excluded_slot_ids
         )
         
-        # Add the NEW suggestions to history for next time
-        if scheduling_result.suggested_slots:
-            new_slot_ids = [sugg.get('slot_id') for sugg in scheduling_result.suggested_slots if sugg.get('slot_id')]
-            session.add_to_suggested_history(new_slot_ids)
-            print(f"🔍 RE-SUGGESTION DEBUG - Added {len(new_slot_ids)} new suggestions to history: {new_slot_ids}")
-        
-        # Update session with new suggestions
-        session.suggestions_json = json.dumps(scheduling_result.suggested_slots)
+        # Store the new suggestions and record current + NEW ones in history, in one UPDATE.
+        # JSON_MERGE_PRESERVE only appends, so pass just the IDs not already in the history
+        new_slot_ids = [sugg.get('slot_id') for sugg in scheduling_result.suggested_slots if sugg.get('slot_id')]
+        known_slot_ids = set(history_slot_ids)
+        unseen_slot_ids = [sid for sid in dict.fromkeys(current_slot_ids + new_slot_ids) if sid not in known_slot_ids]
+        session_crud.store_suggestions(
+            db, session.id, scheduling_result.suggested_slots, unseen_slot_ids
+        )
+        logger.debug("Re-suggestion added %d new suggestions to history: %s", len(new_slot_ids), new_slot_ids)
         db.commit()
         
         # Return new suggestions in the same format as original
-        return SuggestionResponse(
+        response = SuggestionResponse(
             message="Session-based re-suggestion completed",
             algorithm="CP-SAT (Constraint Programming Satisfiability)",
             suggestions=scheduling_result.suggested_slots,
             total_suggestions=scheduling_result.total_suggestions,
-            client_id=getattr(session, 'client_id'),
+            client_id=session.client_id,
             solver_status=scheduling_result.solver_status,
             solve_time_ms=scheduling_result.solve_time_ms,
             confidence_score=scheduling_result.confidence_score,
             session_token=session_token,
-            expires_at=getattr(session, 'expires_at').isoformat()
+            expires_at=session.expires_at.isoformat()
         )
+        # Dump to JSON in one pass instead of going through jsonable_encoder
+        return Response(response.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Session re-suggestion failed: {str(e)}")
@@ -1049,7 +1122,7 @@ def re_suggest_session_based(
 def re_suggest_individual_slot(
     request: IndividualReSuggestionRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_auth)
+    email: str = Depends(require_token_subject)
 ):
     """
     Re-suggest a single slot while keeping other suggestions the same.
@@ -1058,46 +1131,21 @@ def re_suggest_individual_slot(
         request: Individual re-suggestion request containing session_token and slot_id
     """
     
-    import json
-    from app.models.suggestion_session import SuggestionSession
-    
     # Extract parameters from request
     session_token = request.session_token
     slot_id = request.slot_id
     
+    # Authorize and load the session in one query (the token is in the body, so not a dependency)
+    _, session = _load_owned_session(db, session_token, email)
+    
     try:
-        # Find the session
-        session = db.query(SuggestionSession).filter(
-            SuggestionSession.session_token == session_token,
-            SuggestionSession.is_active == True
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found or expired")
-        
-        # Validate access
-        if getattr(session, 'client_id') != getattr(current_user, 'id'):
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        # Check expiry
-        current_time = datetime.utcnow()
-        if current_time > getattr(session, 'expires_at'):
-            raise HTTPException(status_code=410, detail="Session has expired")
-        
-        # Get current suggestions
-        current_suggestions = json.loads(getattr(session, 'suggestions_json'))
-        
-        # Find the suggestion to replace
-        target_suggestion = None
-        for sugg in current_suggestions:
-            if sugg.get('slot_id') == slot_id:
-                target_suggestion = sugg
-                break
+        # Find the suggestion to replace and its position in the list
+        target_position, target_suggestion = session.find_suggestion(slot_id)
         
         if not target_suggestion:
             raise HTTPException(status_code=404, detail=f"Slot ID {slot_id} not found in current suggestions")
         
-        print(f"🔍 INDIVIDUAL RE-SUGGESTION DEBUG - Replacing slot {slot_id}")
+        logger.debug("Individual re-suggestion replacing slot %s", slot_id)
         
         # Get excluded slots: all historical + current other suggestions + the slot we want to replace
         excluded_slot_ids = session.get_all_suggested_slots()
@@ -1105,23 +1153,23 @@ def re_suggest_individual_slot(
         if slot_id not in excluded_slot_ids:
             excluded_slot_ids.append(slot_id)
         
-        print(f"🔍 INDIVIDUAL RE-SUGGESTION DEBUG - Excluding {len(excluded_slot_ids)} slots: {excluded_slot_ids}")
+        logger.debug("Individual re-suggestion excluding %d slots: %s", len(excluded_slot_ids), excluded_slot_ids)
         
         # Generate ONE new suggestion to replace this slot
-        scheduler = CPSATScheduler(db)
+        scheduler = scheduler_service.CPSATScheduler(db)
         
         # Convert preferred date from session
         preferred_datetime = None
-        session_preferred_date = getattr(session, 'preferred_date')
+        session_preferred_date = session.preferred_date
         if session_preferred_date:
-            preferred_datetime = datetime.strptime(session_preferred_date, "%Y-%m-%d")
+            preferred_datetime = datetime.fromisoformat(session_preferred_date)
         
         # Generate new suggestion for just 1 slot
         scheduling_result = scheduler.suggest_optimal_bookings(
-            client_id=getattr(session, 'client_id'),
+            client_id=session.client_id,
             num_sessions=1,  # Just 1 replacement slot
             preferred_date=preferred_datetime,
-            days_flexibility=getattr(session, 'days_flexibility'),
+            days_flexibility=session.days_flexibility,
             excluded_slot_ids=excluded_slot_ids
         )
         
@@ -1132,20 +1180,9 @@ def re_suggest_individual_slot(
         new_suggestion = scheduling_result.suggested_slots[0]
         new_slot_id = new_suggestion.get('slot_id')
         
-        # Update the suggestions list
-        updated_suggestions = []
-        for sugg in current_suggestions:
-            if sugg.get('slot_id') == slot_id:
-                updated_suggestions.append(new_suggestion)  # Replace with new suggestion
-            else:
-                updated_suggestions.append(sugg)  # Keep existing suggestions
-        
-        # Add the new slot to history
-        session.add_to_suggested_history([new_slot_id])
-        print(f"🔍 INDIVIDUAL RE-SUGGESTION DEBUG - Replaced slot {slot_id} with slot {new_slot_id}")
-        
-        # Update session with new suggestions
-        session.suggestions_json = json.dumps(updated_suggestions)
+        # Replace just this suggestion (keeping the others in place) and add the new slot to history
+        session_crud.replace_suggestion(db, session.id, target_position, new_suggestion, [new_slot_id])
+        logger.debug("Individual re-suggestion replaced slot %s with slot %s", slot_id, new_slot_id)
         db.commit()
         
         # Return the single new suggestion
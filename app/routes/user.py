@@ -1,8 +1,15 @@
 # routes/user.py
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import func, select
+from typing import Annotated, Dict, List, Optional, Tuple
+from functools import lru_cache
+import hashlib
+import threading
+import time
 
 import app.schemas.user as schemas
 from app.schemas.user import UserUpdate, ProfileUpdate, PasswordChange, UserProfile
@@ -16,9 +23,10 @@ import app.auth.jwt_handler as jwt_handler
 from app.auth.jwt_handler import decode_access_token
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
-# Dependency to get DB session
+# Dependency to get DB session. Kept sync so the close (which returns the
+# connection to the pool with a reset ROLLBACK) runs in the threadpool.
 def get_db():
     db = database.SessionLocal()
     try:
@@ -28,16 +36,52 @@ def get_db():
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security),
-                           db: Session = Depends(get_db)):
-    token = credentials.credentials
+# Decoded JWT payloads keyed by sha256(token) -- raw tokens are never stored
+TOKEN_CACHE_TTL_SECONDS = 30
+TOKEN_CACHE_MAX_ENTRIES = 10000
+_token_cache: Dict[str, Tuple[float, dict]] = {}
+_token_cache_lock = threading.Lock()
+
+def _decode_token_cached(token: str) -> Optional[dict]:
+    """Decode a JWT, reusing the payload for repeated requests with the same token"""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
     payload = decode_access_token(token)
+    if payload is None:
+        return None
+
+    # Never cache a payload past the token's own expiry
+    expires = now + TOKEN_CACHE_TTL_SECONDS
+    if "exp" in payload:
+        expires = min(expires, float(payload["exp"]))
+    with _token_cache_lock:
+        if len(_token_cache) >= TOKEN_CACHE_MAX_ENTRIES:
+            for stale_key in [k for k, (exp, _) in _token_cache.items() if exp <= now]:
+                del _token_cache[stale_key]
+            if len(_token_cache) >= TOKEN_CACHE_MAX_ENTRIES:
+                _token_cache.clear()
+        _token_cache[key] = (expires, payload)
+    return payload
+
+async def get_token_subject(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    """Validate the bearer token and return its subject (the user's email) without a DB lookup"""
+    token = credentials.credentials
+    payload = _decode_token_cached(token)
     if payload is None or "sub" not in payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
         )
-    user = crud.get_user_by_email(db, payload["sub"])
+    return payload["sub"]
+
+async def get_current_user(email: str = Depends(get_token_subject),
+                           db: Session = Depends(get_db)):
+    user = crud.get_user_by_email_cached(db, email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,54 +89,38 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
     return user
 
+# One shared dependency marker, so FastAPI resolves the user once per request
+# (per-request dependency caching) however many dependencies ask for it
+CurrentUser = Annotated[User, Depends(get_current_user)]
+
 # Role-based dependencies
-async def require_coach_role(current_user: User = Depends(get_current_user)) -> User:
-    """Dependency that requires the user to have coach role"""
-    if getattr(current_user, 'role') != UserRole.COACH:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Coach privileges required."
-        )
-    return current_user
+@lru_cache(maxsize=None)
+def require_roles(*roles: UserRole):
+    """Build (once per role combination) a dependency that requires one of the given roles"""
+    allowed = frozenset(roles)
+    detail = f"Access denied. {' or '.join(role.value.capitalize() for role in roles)} privileges required."
 
-async def require_client_role(current_user: User = Depends(get_current_user)) -> User:
-    """Dependency that requires the user to have client role"""
-    if getattr(current_user, 'role') != UserRole.CLIENT:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Client privileges required."
-        )
-    return current_user
+    async def role_checker(current_user: CurrentUser) -> User:
+        if current_user.role not in allowed:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+        return current_user
 
-async def require_accountant_role(current_user: User = Depends(get_current_user)) -> User:
-    """Dependency that requires the user to have accountant role"""
-    if getattr(current_user, 'role') != UserRole.ACCOUNTANT:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Accountant privileges required."
-        )
-    return current_user
+    return role_checker
 
-async def require_coach_or_accountant_role(current_user: User = Depends(get_current_user)) -> User:
-    """Dependency that requires the user to have coach or accountant role"""
-    if getattr(current_user, 'role') not in [UserRole.COACH, UserRole.ACCOUNTANT]:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Coach or Accountant privileges required."
-        )
-    return current_user
+require_coach_role = require_roles(UserRole.COACH)
+require_client_role = require_roles(UserRole.CLIENT)
+require_accountant_role = require_roles(UserRole.ACCOUNTANT)
+require_coach_or_accountant_role = require_roles(UserRole.COACH, UserRole.ACCOUNTANT)
 
-def check_self_or_coach_access(current_user: User, target_user_id: int) -> bool:
+def check_self_or_coach_access(current_user: User, target_user_id: int, db: Session) -> bool:
     """Check if user can access another user's data (self or if coach accessing client)"""
     # User can always access their own data
-    if getattr(current_user, 'id') == target_user_id:
+    if current_user.id == target_user_id:
         return True
     
     # If current user is a coach, check if target user is their client
-    if getattr(current_user, 'role') == UserRole.COACH:
-        # Check if target_user_id is in the coach's clients
-        client_ids = [getattr(client, 'id') for client in getattr(current_user, 'clients', [])]
-        return target_user_id in client_ids
+    if current_user.role == UserRole.COACH:
+        return crud.coach_has_client(db, current_user.id, target_user_id)
     
     return False
 
@@ -118,20 +146,21 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
 # ==== BASIC USER ENDPOINTS ====
 
 @router.get("/me", response_model=schemas.UserOut)
-async def read_current_user(current_user: User = Depends(get_current_user)):
+async def read_current_user(current_user: CurrentUser):
     return current_user
 
 @router.put("/me", response_model=schemas.UserOut)
 async def update_current_user(
     updates: UserUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db),
 ):
-    return crud.update_user(db, current_user, updates)
+    # update_user hashes a new password (bcrypt), so keep it off the event loop
+    return await run_in_threadpool(crud.update_user, db, current_user, updates)
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_current_user(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db),
 ):
     crud.delete_user(db, current_user)
@@ -139,44 +168,41 @@ async def delete_current_user(
 
 # ==== PROFILE MANAGEMENT ENDPOINTS ====
 
-@router.get("/profile", response_model=UserProfile)
-async def get_current_user_profile(current_user: User = Depends(get_current_user)):
-    """Get current user's detailed profile with time preferences"""
-    # Convert user to profile format with time preferences
+def _user_profile(user: User) -> UserProfile:
+    """Build the profile response from a user's loaded attributes"""
+    # time_preferences is a JSON column, so it is already a dict (or None)
     time_preferences = None
-    if hasattr(current_user, 'time_preferences') and current_user.time_preferences:
-        # Parse time preferences from JSON if stored as string, or use directly if dict
-        prefs = current_user.time_preferences
-        if isinstance(prefs, str):
-            import json
-            try:
-                prefs = json.loads(prefs)
-            except:
-                prefs = {}
-        
-        time_preferences = schemas.TimePreferences(
+    prefs = user.time_preferences
+    if prefs:
+        time_preferences = schemas.TimePreferences.model_construct(
             preferred_start_time=prefs.get('preferred_start_time'),
             preferred_end_time=prefs.get('preferred_end_time'),
             preferred_days=prefs.get('preferred_days', [])
         )
     
-    return UserProfile(
-        id=current_user.id,
-        username=current_user.username,
-        email=current_user.email,
-        role=current_user.role,
-        first_name=current_user.first_name,
-        last_name=current_user.last_name,
-        phone=current_user.phone,
-        avatar=getattr(current_user, 'avatar', None),
+    # Values come from the database, so skip re-validation
+    return UserProfile.model_construct(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        role=user.role,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        phone=user.phone,
+        avatar=user.avatar,
         time_preferences=time_preferences,
-        created_at=current_user.created_at
+        created_at=user.created_at
     )
 
+@router.get("/profile", response_model=UserProfile)
+async def get_current_user_profile(current_user: CurrentUser):
+    """Get current user's detailed profile with time preferences"""
+    return _user_profile(current_user)
+
 @router.put("/profile", response_model=UserProfile)
 async def update_current_user_profile(
     profile_update: ProfileUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db),
 ):
     """Update current user's profile including time preferences"""
@@ -203,42 +229,48 @@ async def update_current_user_profile(
     
     # Handle time preferences
     if profile_update.time_preferences is not None:
-        import json
         time_prefs_dict = {
             'preferred_start_time': profile_update.time_preferences.preferred_start_time,
             'preferred_end_time': profile_update.time_preferences.preferred_end_time,
             'preferred_days': profile_update.time_preferences.preferred_days or []
         }
-        update_data['time_preferences'] = json.dumps(time_prefs_dict)
+        update_data['time_preferences'] = time_prefs_dict
     
-    # Update user in database
+    # Update user in database (current_user may be a detached cached snapshot)
+    user = crud.get_user_for_update(db, current_user)
     for field, value in update_data.items():
-        setattr(current_user, field, value)
+        setattr(user, field, value)
     
+    # Build the response from the values just set, before commit expires them,
+    # so no refresh SELECT is needed
+    profile = _user_profile(user)
     db.commit()
-    db.refresh(current_user)
+    crud.invalidate_cached_user(user.email)
     
-    # Return updated profile
-    return await get_current_user_profile(current_user)
+    return profile
 
 @router.put("/change-password")
 async def change_password(
     password_change: PasswordChange,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db),
 ):
     """Change user's password"""
     # Verify current password
-    if not crud.verify_password(password_change.current_password, current_user.hashed_password):
+    # bcrypt is deliberately slow; run it in the threadpool so the event loop keeps serving
+    if not await run_in_threadpool(crud.verify_password, password_change.current_password,
+                                   current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
     
     # Hash new password and update
-    hashed_new_password = crud.get_password_hash(password_change.new_password)
-    current_user.hashed_password = hashed_new_password
+    hashed_new_password = await run_in_threadpool(crud.get_password_hash, password_change.new_password)
+    user = crud.get_user_for_update(db, current_user)
+    user.hashed_password = hashed_new_password
     db.commit()
+    crud.invalidate_cached_user(user.email)
     
     return {"message": "Password changed successfully"}
 
@@ -246,8 +278,8 @@ async def change_password(
 
 @router.get("/coaches", response_model=List[schemas.CoachLimited])
 async def get_all_coaches(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
     """Get all coaches - accessible by any authenticated user"""
     coaches = crud.get_all_coaches(db)
@@ -260,39 +292,28 @@ async def get_all_clients(
     current_user: User = Depends(require_coach_or_accountant_role)
 ):
     """Get all clients - coach and accountant endpoint"""
-    if search:
-        clients = crud.search_users_by_role(db, UserRole.CLIENT, search)
-    else:
-        clients = crud.get_all_clients(db)
+    rows = crud.get_clients_with_primary_coach(db, search)
     
-    # Convert to response model with assigned coach info
-    result = []
-    for client in clients:
-        # Create client dict with assigned coach
-        assigned_coach = None
-        if client.coaches and len(client.coaches) > 0:
-            coach = client.coaches[0]
-            assigned_coach = {
-                "id": coach.id,
-                "username": coach.username,
-                "first_name": coach.first_name,
-                "last_name": coach.last_name,
-                "phone": coach.phone
-            }
-        
-        client_dict = {
-            "id": client.id,
-            "username": client.username,
-            "email": client.email,
-            "first_name": client.first_name,
-            "last_name": client.last_name,
-            "phone": client.phone,
-            "created_at": client.created_at,
-            "assigned_coach": assigned_coach
-        }
-        result.append(client_dict)
-    
-    return result
+    # Rows come straight from the database, so build the response models without re-validating
+    return [
+        schemas.ClientOut.model_construct(
+            id=row.id,
+            username=row.username,
+            email=row.email,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            phone=row.phone,
+            created_at=row.created_at,
+            assigned_coach=schemas.CoachLimited.model_construct(
+                id=row.coach_id,
+                username=row.coach_username,
+                first_name=row.coach_first_name,
+                last_name=row.coach_last_name,
+                phone=row.coach_phone
+            ) if row.coach_id is not None else None
+        )
+        for row in rows
+    ]
 
 @router.get("/my-clients", response_model=List[schemas.ClientOut])
 async def get_my_clients(
@@ -300,7 +321,7 @@ async def get_my_clients(
     db: Session = Depends(get_db)
 ):
     """Get all clients assigned to the current coach"""
-    clients = crud.get_coach_clients(db, getattr(current_user, 'id'))
+    clients = crud.get_coach_clients(db, current_user.id)
     return clients
 
 @router.post("/assign-client/{client_id}")
@@ -310,7 +331,7 @@ async def assign_client_to_me(
     db: Session = Depends(get_db)
 ):
     """Assign a client to the current coach"""
-    success = crud.assign_client_to_coach(db, getattr(current_user, 'id'), client_id)
+    success = crud.assign_client_to_coach(db, current_user.id, client_id)
     if success:
         return {"message": "Client assigned successfully"}
     else:
@@ -319,7 +340,7 @@ async def assign_client_to_me(
 @router.post("/select-coach/{coach_id}")
 async def select_coach_for_me(
     coach_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db)
 ):
     """Allow a client to select and assign themselves to a coach"""
@@ -331,7 +352,7 @@ async def select_coach_for_me(
     if not coach or coach.role != UserRole.COACH:
         raise HTTPException(status_code=404, detail="Coach not found")
     
-    success = crud.assign_client_to_coach(db, coach_id, getattr(current_user, 'id'))
+    success = crud.assign_client_to_coach(db, coach_id, current_user.id)
     if success:
         return {"message": f"Successfully selected {coach.first_name} {coach.last_name} as your coach"}
     else:
@@ -344,7 +365,7 @@ async def remove_client_from_me(
     db: Session = Depends(get_db)
 ):
     """Remove a client from the current coach"""
-    success = crud.remove_client_from_coach(db, getattr(current_user, 'id'), client_id)
+    success = crud.remove_client_from_coach(db, current_user.id, client_id)
     if success:
         return {"message": "Client removed successfully"}
     else:
@@ -358,7 +379,7 @@ async def get_my_coaches(
     db: Session = Depends(get_db)
 ):
     """Get all coaches assigned to the current client"""
-    coaches = crud.get_client_coaches(db, getattr(current_user, 'id'))
+    coaches = crud.get_client_coaches(db, current_user.id)
     return coaches
 
 # ==== MIXED ACCESS ENDPOINTS ====
@@ -366,11 +387,11 @@ async def get_my_coaches(
 @router.get("/profile/{user_id}", response_model=schemas.UserOut)
 async def get_user_profile(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: Session = Depends(get_db)
 ):
     """Get user profile - accessible by self or assigned coach"""
-    if not check_self_or_coach_access(current_user, user_id):
+    if not check_self_or_coach_access(current_user, user_id, db):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied. You can only view your own profile or your clients' profiles."
@@ -389,78 +410,91 @@ async def get_client_profile_with_membership(
     db: Session = Depends(get_db)
 ):
     """Get client profile with membership information - coach only"""
-    from app.models.payment import Payment, PaymentStatus
-    from sqlalchemy import desc
-    from datetime import datetime
-    
-    # Check if the client is assigned to this coach
-    client = crud.get_user_by_id(db, client_id)
-    if not client or str(client.role) != "UserRole.CLIENT":
+    # Client row, coach assignment and latest paid membership in a single round-trip
+    row = crud.get_client_profile_for_coach(db, current_user.id, client_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Client not found")
     
     # Check if this coach has access to this client
-    coach_clients = crud.get_coach_clients(db, getattr(current_user, 'id'))
-    client_ids = [c.id for c in coach_clients]
-    
-    if client_id not in client_ids:
+    if not row.is_assigned:
         raise HTTPException(
             status_code=403,
             detail="Access denied. You can only view your assigned clients' profiles."
         )
     
-    # Get the latest paid membership/payment for this client
-    latest_payment = db.query(Payment).filter(
-        Payment.client_id == client_id,
-        Payment.status == PaymentStatus.PAID
-    ).order_by(desc(Payment.paid_at)).first()
-    
     # Prepare membership info
     membership_info = None
-    if latest_payment:
+    if row.payment_id is not None:
         membership_info = {
-            "member_since": latest_payment.paid_at,
-            "active_until": latest_payment.active_until,
-            "plan_name": latest_payment.plan_name,
+            "member_since": row.paid_at,
+            "active_until": row.active_until,
+            "plan_name": row.plan_name,
             "status": "Active"  # Simplified for now - can enhance later
         }
     
     # Prepare client profile response
     client_profile = {
-        "id": client.id,
-        "username": client.username,
-        "email": client.email,
-        "first_name": client.first_name,
-        "last_name": client.last_name,
-        "phone": client.phone,
-        "created_at": client.created_at,
+        "id": row.id,
+        "username": row.username,
+        "email": row.email,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "phone": row.phone,
+        "created_at": row.created_at,
         "membership": membership_info
     }
     
     return client_profile
 
 # Public endpoint for member statistics (for landing page)
+# Landing-page statistics change slowly; serve them from memory for a short while
+MEMBER_STATS_TTL_SECONDS = 30
+_member_stats_cache: Dict[str, object] = {"expires": 0.0, "value": None}
+
 @router.get("/stats/members")
-def get_member_statistics(db: Session = Depends(get_db)):
+async def get_member_statistics(db: Session = Depends(get_db)):
     """Get public member statistics for landing page."""
+    now = time.monotonic()
+    if _member_stats_cache["value"] is not None and _member_stats_cache["expires"] > now:
+        return _member_stats_cache["value"]
     
-    # Count total members (clients)
-    total_members = db.query(User).filter(User.role == UserRole.CLIENT).count()
-    
-    # Count active members (clients with paid subscriptions that are still active)
+    # Only a cache miss needs a worker thread for the blocking query
+    stats = await run_in_threadpool(_compute_member_statistics, db)
+    _member_stats_cache["value"] = stats
+    _member_stats_cache["expires"] = now + MEMBER_STATS_TTL_SECONDS
+    return stats
+
+def _compute_member_statistics(db: Session) -> dict:
+    """Count total and active members in a single query"""
     from app.models.payment import Payment, PaymentStatus
     from datetime import datetime
     
-    active_members = db.query(User).filter(
-        User.role == UserRole.CLIENT,
-        User.id.in_(
-            db.query(Payment.client_id).filter(
-                Payment.status == PaymentStatus.PAID,
-                Payment.active_until > datetime.now()
-            ).distinct()
+    # Count total members (clients)
+    total_members = (
+        select(func.count(User.id))
+        .where(User.role == UserRole.CLIENT)
+        .scalar_subquery()
+    )
+    
+    # Count active members (clients with paid subscriptions that are still active)
+    # straight from payments, instead of an IN-subquery over users
+    active_members = (
+        select(func.count(func.distinct(Payment.client_id)))
+        .join(User, User.id == Payment.client_id)
+        .where(
+            User.role == UserRole.CLIENT,
+            Payment.status == PaymentStatus.PAID,
+            Payment.active_until > datetime.now()
         )
-    ).count()
+        .scalar_subquery()
+    )
+    
+    # Both counts in a single round-trip
+    row = db.execute(
+        select(total_members.label("total_members"), active_members.label("active_members"))
+    ).one()
     
     return {
-        "total_members": total_members,
-        "active_members": active_members
+        "total_members": row.total_members,
+        "active_members": row.active_members
     }
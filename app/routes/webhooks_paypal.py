@@ -2,23 +2,108 @@
 # PayPal webhook handling for payment events
 
 from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import bindparam, insert, select
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta, timezone
-import json
+from datetime import datetime, timezone
+from typing import Dict, Optional
 import logging
+import orjson
+import re
+import threading
+import time
 
 from database import get_db
 from app.models.payment import Payment, PaymentStatus
 from app.integrations.paypal import paypal_client
 from app.crud import payment as payment_crud
+from app.services.subscriptions import subscription_active_until
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/webhooks/paypal")
+router = APIRouter(prefix="/webhooks/paypal", default_response_class=ORJSONResponse)
 
 # Reuse existing processed_events table for deduplication
 from app.models.processed_event import ProcessedEvent
 
+# PayPal redelivers events routinely. Recently processed event IDs are kept in
+# memory so hot retries are answered without touching the database.
+PROCESSED_EVENT_CACHE_TTL_SECONDS = 600
+PROCESSED_EVENT_CACHE_MAX_ENTRIES = 10000
+_processed_event_cache: Dict[str, float] = {}
+_processed_event_cache_lock = threading.Lock()
+
+# Webhook event IDs look like "WH-..."; resource IDs nested in the payload never do
+_EVENT_ID_PATTERN = re.compile(rb'"id"\s*:\s*"(WH-[^"]+)"')
+_ORDER_ID_PATTERN = re.compile(r"/orders/([^/?#]+)")
+
+def _peek_event_id(webhook_body: bytes) -> Optional[str]:
+    """Pull the event ID out of the raw body without parsing the whole payload"""
+    match = _EVENT_ID_PATTERN.search(webhook_body)
+    return match.group(1).decode() if match else None
+
+def _remember_processed(event_id: str) -> None:
+    """Record an event ID as processed in the in-process cache"""
+    now = time.monotonic()
+    # Called from threadpool workers, so pruning must not race another writer
+    with _processed_event_cache_lock:
+        if len(_processed_event_cache) >= PROCESSED_EVENT_CACHE_MAX_ENTRIES:
+            for stale_id in [k for k, exp in _processed_event_cache.items() if exp <= now]:
+                del _processed_event_cache[stale_id]
+            if len(_processed_event_cache) >= PROCESSED_EVENT_CACHE_MAX_ENTRIES:
+                _processed_event_cache.clear()
+        _processed_event_cache[event_id] = now + PROCESSED_EVENT_CACHE_TTL_SECONDS
+
+def _claim_event(db: Session, event_id: str) -> bool:
+    """Insert the event ID into processed_events; False if it was already there.
+
+    INSERT IGNORE against the event_id primary key is atomic: of two concurrent
+    deliveries, the second blocks on the first's row lock and then inserts
+    nothing. The row is only committed together with the event's processing, so
+    a failure rolls it back and PayPal's retry can claim the event again.
+    """
+    result = db.execute(insert(ProcessedEvent).prefix_with("IGNORE").values(event_id=event_id))
+    return result.rowcount == 1
+
+def _in_processed_cache(event_id: str) -> bool:
+    """Check the in-process cache of recently processed event IDs"""
+    expires = _processed_event_cache.get(event_id)
+    return expires is not None and expires > time.monotonic()
+
+def _is_processed(db: Session, event_id: str) -> bool:
+    """Check the in-process cache, then the processed_events table (column-only SELECT)"""
+    if _in_processed_cache(event_id):
+        return True
+    found = db.execute(
+        select(ProcessedEvent.event_id).where(ProcessedEvent.event_id == event_id)
+    ).first() is not None
+    if found:
+        _remember_processed(event_id)
+    return found
+
+# PayPal event payloads are a few KB; anything far larger is not a PayPal webhook
+WEBHOOK_MAX_BODY_BYTES = 64_000
+
+async def _read_body_capped(request: Request) -> bytes:
+    """Read the request body, rejecting it with 413 once it exceeds WEBHOOK_MAX_BODY_BYTES"""
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared > WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    
+    # Count while streaming too: the header may be missing (chunked) or wrong
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > WEBHOOK_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    return bytes(body)
+
 @router.post("/webhook", include_in_schema=False)
 async def handle_paypal_webhook(
     request: Request,
@@ -26,50 +111,20 @@ async def handle_paypal_webhook(
 ):
     """Handle PayPal webhook events (internal use only - called by PayPal)"""
     
-    print("🚀 DEBUG: PayPal webhook received!")
-    
     try:
-        # Get raw webhook body
-        webhook_body = await request.body()
-        
-        # Parse webhook event
-        try:
-            event = json.loads(webhook_body.decode())
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in PayPal webhook")
-            raise HTTPException(status_code=400, detail="Invalid JSON")
+        # Get raw webhook body (size-capped)
+        webhook_body = await _read_body_capped(request)
         
-        # Extract event details
-        event_id = event.get("id")
-        event_type = event.get("event_type")
-        
-        if not event_id or not event_type:
-            logger.error("Missing event_id or event_type in PayPal webhook")
-            raise HTTPException(status_code=400, detail="Missing required fields")
-        
-        # Check if we've already processed this event (idempotency)
-        existing_event = db.query(ProcessedEvent).filter_by(event_id=event_id).first()
-        if existing_event:
-            logger.info(f"PayPal webhook event {event_id} already processed")
+        # Hot retries of a recently processed event are answered right here,
+        # without a database query or a worker thread
+        peeked_event_id = _peek_event_id(webhook_body)
+        if peeked_event_id and _in_processed_cache(peeked_event_id):
+            logger.info(f"PayPal webhook event {peeked_event_id} already processed")
             return {"status": "already_processed"}
         
-        # Verify webhook signature
-        if not paypal_client.verify_webhook(request, webhook_body):
-            logger.error(f"PayPal webhook signature verification failed for event {event_id}")
-            raise HTTPException(status_code=400, detail="Webhook signature verification failed")
-        
-        # Process the webhook event
-        result = await process_paypal_event(db, event)
-        
-        # Mark event as processed
-        processed_event = ProcessedEvent(
-            event_id=event_id
-        )
-        db.add(processed_event)
-        db.commit()
-        
-        logger.info(f"PayPal webhook event {event_id} processed successfully")
-        return {"status": "processed", "result": result}
+        # Everything else blocks (SQLAlchemy queries, PayPal HTTPS calls), so it
+        # runs in the threadpool and the event loop keeps serving other requests
+        return await run_in_threadpool(_handle_webhook_body, db, request, webhook_body, peeked_event_id)
         
     except HTTPException:
         raise
@@ -77,44 +132,94 @@ async def handle_paypal_webhook(
         logger.error(f"Unexpected error processing PayPal webhook: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-async def process_paypal_event(db: Session, event: dict) -> dict:
+def _handle_webhook_body(db: Session, request: Request, webhook_body: bytes,
+                         peeked_event_id: Optional[str]) -> dict:
+    """Deduplicate, verify and process one webhook delivery (blocking)"""
+    # Answer duplicate deliveries before the JSON parse and the signature
+    # verification round-trip to PayPal
+    if peeked_event_id and _is_processed(db, peeked_event_id):
+        logger.info(f"PayPal webhook event {peeked_event_id} already processed")
+        return {"status": "already_processed"}
+    
+    # Parse webhook event
+    try:
+        event = orjson.loads(webhook_body)
+    except orjson.JSONDecodeError:
+        logger.error("Invalid JSON in PayPal webhook")
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    
+    # Extract event details
+    event_id = event.get("id")
+    event_type = event.get("event_type")
+    
+    if not event_id or not event_type:
+        logger.error("Missing event_id or event_type in PayPal webhook")
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    
+    # Event types we don't act on need no verification, dedup row or commit
+    if event_type not in _EVENT_HANDLERS:
+        logger.info(f"Unhandled PayPal webhook event type: {event_type}")
+        return {"status": "processed", "result": {"status": "ignored", "reason": "unhandled_event_type"}}
+    
+    # Claim the event atomically (idempotency)
+    if not _claim_event(db, event_id):
+        logger.info(f"PayPal webhook event {event_id} already processed")
+        return {"status": "already_processed"}
+    
+    # Verify webhook signature
+    if not paypal_client.verify_webhook(request, webhook_body):
+        logger.error(f"PayPal webhook signature verification failed for event {event_id}")
+        db.rollback()  # release the claim so a genuine delivery is not treated as a duplicate
+        raise HTTPException(status_code=400, detail="Webhook signature verification failed")
+    
+    # Process the webhook event
+    result = process_paypal_event(db, event)
+    
+    # Commit the processed_events claim (handlers that changed a payment
+    # have already committed it together with their update)
+    db.commit()
+    _remember_processed(event_id)
+    
+    logger.info(f"PayPal webhook event {event_id} processed successfully")
+    return {"status": "processed", "result": result}
+
+# Built once at import; paypal_order_id / paypal_capture_id are unique-indexed
+_PAYMENT_BY_ORDER_ID = (
+    select(Payment).where(Payment.paypal_order_id == bindparam("order_id")).with_for_update()
+)
+_PAYMENT_BY_CAPTURE_ID = (
+    select(Payment).where(Payment.paypal_capture_id == bindparam("capture_id")).with_for_update()
+)
+
+def _lock_payment_by_order(db: Session, order_id: str) -> Optional[Payment]:
+    """Load a payment by PayPal order ID with SELECT ... FOR UPDATE.
+
+    Handlers check the payment status and then change it; holding the row lock
+    until their commit serializes concurrent events for the same order (e.g.
+    ORDER.APPROVED racing CAPTURE.COMPLETED) without blocking other orders.
+    """
+    return db.execute(_PAYMENT_BY_ORDER_ID, {"order_id": order_id}).scalar_one_or_none()
+
+def _lock_payment_by_capture(db: Session, capture_id: str) -> Optional[Payment]:
+    """Load a payment by PayPal capture ID with SELECT ... FOR UPDATE"""
+    return db.execute(_PAYMENT_BY_CAPTURE_ID, {"capture_id": capture_id}).scalar_one_or_none()
+
+def process_paypal_event(db: Session, event: dict) -> dict:
     """Process individual PayPal webhook events"""
     
     event_type = event.get("event_type")
     resource = event.get("resource", {})
     
-    # Debug logging
-    print(f"🔥 DEBUG: Processing PayPal event: {event_type}")
-    print(f"🔥 DEBUG: Resource ID: {resource.get('id', 'N/A')}")
-    logger.info(f"Processing PayPal event: {event_type}")
-    logger.info(f"Resource ID: {resource.get('id', 'N/A')}")
+    logger.info(f"Processing PayPal event: {event_type} (resource {resource.get('id', 'N/A')})")
     
-    if event_type == "CHECKOUT.ORDER.APPROVED":
-        # Optional: Order approved but not yet captured
-        return await handle_order_approved(db, event, resource)
-        
-    elif event_type == "PAYMENT.CAPTURE.COMPLETED":
-        # Payment captured successfully
-        return await handle_payment_captured(db, event, resource)
-        
-    elif event_type == "PAYMENT.CAPTURE.DENIED":
-        # Payment capture denied
-        return await handle_payment_denied(db, event, resource)
-        
-    elif event_type == "PAYMENT.CAPTURE.REFUNDED":
-        # Payment refunded
-        return await handle_payment_refunded(db, event, resource)
-        
-    elif event_type == "CHECKOUT.ORDER.CANCELLED":
-        # Order cancelled
-        return await handle_order_cancelled(db, event, resource)
-        
-    else:
+    handler = _EVENT_HANDLERS.get(event_type)
+    if handler is None:
         # Unhandled event type
         logger.info(f"Unhandled PayPal webhook event type: {event_type}")
         return {"status": "ignored", "reason": "unhandled_event_type"}
+    return handler(db, event, resource)
 
-async def handle_order_approved(db: Session, event: dict, resource: dict) -> dict:
+def handle_order_approved(db: Session, event: dict, resource: dict) -> dict:
     """Handle CHECKOUT.ORDER.APPROVED event"""
     order_id = resource.get("id")
     
@@ -123,14 +228,19 @@ async def handle_order_approved(db: Session, event: dict, resource: dict) -> dic
         return {"status": "error", "reason": "missing_order_id"}
     
     # Find payment by PayPal order ID
-    payment = db.query(Payment).filter_by(paypal_order_id=order_id).first()
+    payment = _lock_payment_by_order(db, order_id)
     
     if not payment:
         logger.warning(f"Payment not found for PayPal order {order_id}")
         return {"status": "warning", "reason": "payment_not_found"}
     
+    # A concurrent CAPTURE.COMPLETED (or a retry) may already have settled it
+    if payment.status in [PaymentStatus.PAID, PaymentStatus.FAILED, PaymentStatus.REFUNDED]:
+        logger.info(f"Payment {payment.id} already in terminal state: {payment.status}")
+        return {"status": "already_terminal", "payment_id": payment.id}
+    
     # Order approved - capture the payment immediately
-    print(f"💳 DEBUG: Auto-capturing PayPal order {order_id}")
+    logger.debug(f"Auto-capturing PayPal order {order_id}")
     
     try:
         # Capture the payment using PayPal API
@@ -140,60 +250,51 @@ async def handle_order_approved(db: Session, event: dict, resource: dict) -> dic
             # Update payment status to PAID
             payment.status = PaymentStatus.PAID
             payment.paid_at = datetime.now(timezone.utc)
-            payment.active_until = payment.paid_at + timedelta(days=payment.duration_months * 30)
+            payment.active_until = subscription_active_until(payment.paid_at, payment.duration_months)
             
             db.commit()
-            db.refresh(payment)
             
-            print(f"✅ DEBUG: Payment {payment.id} captured and marked as PAID")
             logger.info(f"PayPal order {order_id} captured and payment {payment.id} marked as PAID")
             return {"status": "payment_captured", "payment_id": payment.id}
         else:
-            print(f"❌ DEBUG: PayPal capture failed: {capture_response}")
+            logger.warning(f"PayPal capture failed for order {order_id}: {capture_response}")
             return {"status": "capture_failed", "response": capture_response}
             
     except Exception as e:
-        print(f"❌ DEBUG: Error capturing payment: {e}")
         logger.error(f"Error capturing PayPal payment {order_id}: {e}")
         return {"status": "capture_error", "error": str(e)}
 
-async def handle_payment_captured(db: Session, event: dict, resource: dict) -> dict:
+def _extract_order_id(resource: dict) -> Optional[str]:
+    """Get the PayPal order ID a capture belongs to"""
+    # Method 1: Check supplementary_data for related order ID
+    order_id = resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+    if order_id:
+        return order_id
+    
+    # Method 2: Check the "up" link, e.g. .../v2/checkout/orders/ORDER_ID
+    for link in resource.get("links", ()):
+        if link.get("rel") == "up":
+            match = _ORDER_ID_PATTERN.search(link.get("href", ""))
+            if match:
+                return match.group(1)
+    return None
+
+def handle_payment_captured(db: Session, event: dict, resource: dict) -> dict:
     """Handle PAYMENT.CAPTURE.COMPLETED event"""
     
     # Extract order ID from the resource or supplementary data
-    order_id = None
-    
-    # Method 1: Check supplementary_data for related order ID
-    supplementary_data = resource.get("supplementary_data", {})
-    related_ids = supplementary_data.get("related_ids", {})
-    order_id = related_ids.get("order_id")
-    
-    # Method 2: Check links for order reference
-    if not order_id:
-        links = resource.get("links", [])
-        for link in links:
-            if link.get("rel") == "up":
-                # Extract order ID from URL like /v2/checkout/orders/ORDER_ID
-                href = link.get("href", "")
-                if "/orders/" in href:
-                    order_id = href.split("/orders/")[-1]
-                    break
+    order_id = _extract_order_id(resource)
     
     if not order_id:
         logger.error("Could not extract order ID from PAYMENT.CAPTURE.COMPLETED event")
         return {"status": "error", "reason": "missing_order_id"}
     
     # Find payment by PayPal order ID
-    print(f"🔍 DEBUG: Looking for payment with PayPal order ID: {order_id}")
-    logger.info(f"Looking for payment with PayPal order ID: {order_id}")
-    payment = db.query(Payment).filter_by(paypal_order_id=order_id).first()
+    logger.debug(f"Looking for payment with PayPal order ID: {order_id}")
+    payment = _lock_payment_by_order(db, order_id)
     
     if not payment:
         logger.warning(f"Payment not found for PayPal order {order_id}")
-        # Debug: Let's see what payments exist
-        all_payments = db.query(Payment).limit(5).all()
-        for p in all_payments:
-            logger.info(f"Existing payment {p.id}: order_id={p.paypal_order_id}, status={p.status}")
         return {"status": "warning", "reason": "payment_not_found"}
     
     # Check if payment is already in terminal state
@@ -209,14 +310,15 @@ async def handle_payment_captured(db: Session, event: dict, resource: dict) -> d
     event_time = event.get("create_time")
     if event_time:
         try:
-            payment.paid_at = datetime.fromisoformat(event_time.replace("Z", "+00:00"))
+            # fromisoformat accepts the trailing "Z" natively on Python 3.11+
+            payment.paid_at = datetime.fromisoformat(event_time)
         except ValueError:
             payment.paid_at = datetime.now(timezone.utc)
     else:
         payment.paid_at = datetime.now(timezone.utc)
     
     # Calculate active_until based on duration
-    payment.active_until = payment.paid_at + timedelta(days=payment.duration_months * 30)
+    payment.active_until = subscription_active_until(payment.paid_at, payment.duration_months)
     
     # Set receipt URL if available
     links = resource.get("links", [])
@@ -226,33 +328,22 @@ async def handle_payment_captured(db: Session, event: dict, resource: dict) -> d
             break
     
     db.commit()
-    db.refresh(payment)
     
     logger.info(f"Payment {payment.id} marked as PAID via PayPal capture {payment.paypal_capture_id}")
     return {"status": "payment_completed", "payment_id": payment.id}
 
-async def handle_payment_denied(db: Session, event: dict, resource: dict) -> dict:
+def handle_payment_denied(db: Session, event: dict, resource: dict) -> dict:
     """Handle PAYMENT.CAPTURE.DENIED event"""
     
-    # Similar order ID extraction logic
-    order_id = None
-    supplementary_data = resource.get("supplementary_data", {})
-    related_ids = supplementary_data.get("related_ids", {})
-    order_id = related_ids.get("order_id")
-    
-    if not order_id:
-        links = resource.get("links", [])
-        for link in links:
-            if link.get("rel") == "up" and "/orders/" in link.get("href", ""):
-                order_id = link.get("href", "").split("/orders/")[-1]
-                break
+    # Same order ID extraction as for captures
+    order_id = _extract_order_id(resource)
     
     if not order_id:
         logger.error("Could not extract order ID from PAYMENT.CAPTURE.DENIED event")
         return {"status": "error", "reason": "missing_order_id"}
     
     # Find and update payment
-    payment = db.query(Payment).filter_by(paypal_order_id=order_id).first()
+    payment = _lock_payment_by_order(db, order_id)
     
     if not payment:
         logger.warning(f"Payment not found for PayPal order {order_id}")
@@ -264,7 +355,7 @@ async def handle_payment_denied(db: Session, event: dict, resource: dict) -> dic
     logger.info(f"Payment {payment.id} marked as FAILED due to capture denial")
     return {"status": "payment_failed", "payment_id": payment.id}
 
-async def handle_payment_refunded(db: Session, event: dict, resource: dict) -> dict:
+def handle_payment_refunded(db: Session, event: dict, resource: dict) -> dict:
     """Handle PAYMENT.CAPTURE.REFUNDED event"""
     
     # For refunds, we need to find the original capture ID
@@ -275,7 +366,7 @@ async def handle_payment_refunded(db: Session, event: dict, resource: dict) -> d
         return {"status": "error", "reason": "missing_capture_id"}
     
     # Find payment by PayPal capture ID
-    payment = db.query(Payment).filter_by(paypal_capture_id=capture_id).first()
+    payment = _lock_payment_by_capture(db, capture_id)
     
     if not payment:
         logger.warning(f"Payment not found for PayPal capture {capture_id}")
@@ -287,7 +378,7 @@ async def handle_payment_refunded(db: Session, event: dict, resource: dict) -> d
     logger.info(f"Payment {payment.id} marked as REFUNDED via PayPal capture {capture_id}")
     return {"status": "payment_refunded", "payment_id": payment.id}
 
-async def handle_order_cancelled(db: Session, event: dict, resource: dict) -> dict:
+def handle_order_cancelled(db: Session, event: dict, resource: dict) -> dict:
     """Handle CHECKOUT.ORDER.CANCELLED event"""
     
     order_id = resource.get("id")
@@ -297,7 +388,7 @@ async def handle_order_cancelled(db: Session, event: dict, resource: dict) -> di
         return {"status": "error", "reason": "missing_order_id"}
     
     # Find payment by PayPal order ID
-    payment = db.query(Payment).filter_by(paypal_order_id=order_id).first()
+    payment = _lock_payment_by_order(db, order_id)
     
     if not payment:
         logger.warning(f"Payment not found for PayPal order {order_id}")
@@ -312,4 +403,13 @@ async def handle_order_cancelled(db: Session, event: dict, resource: dict) -> di
         return {"status": "payment_cancelled", "payment_id": payment.id}
     else:
         logger.info(f"Payment {payment.id} not cancelled - already in state {payment.status}")
-        return {"status": "not_cancelled", "payment_id": payment.id, "current_status": str(payment.status)}
\ No newline at end of file
+        return {"status": "not_cancelled", "payment_id": payment.id, "current_status": str(payment.status)}
+
+# Event type -> handler; everything else is acknowledged and ignored
+_EVENT_HANDLERS = {
+    "CHECKOUT.ORDER.APPROVED": handle_order_approved,      # Order approved, capture it now
+    "PAYMENT.CAPTURE.COMPLETED": handle_payment_captured,  # Payment captured successfully
+    "PAYMENT.CAPTURE.DENIED": handle_payment_denied,       # Payment capture denied
+    "PAYMENT.CAPTURE.REFUNDED": handle_payment_refunded,   # Payment refunded
+    "CHECKOUT.ORDER.CANCELLED": handle_order_cancelled,    # Order cancelled
+}
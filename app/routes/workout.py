@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import re
 from app.routes.user import get_db, require_coach_role, get_current_user
+from app.models.user import UserRole
 from app.schemas.workout import (
     WorkoutTemplateCreate, WorkoutTemplateShow,
     WorkoutPlanCreate, WorkoutPlanShow,
@@ -9,11 +12,10 @@ from app.schemas.workout import (
 )
 from app.crud.workout import (
     create_workout_template, get_workout_templates, get_workout_template,
-    get_templates_by_muscle_group, create_workout_plan, get_workout_plans, 
+    get_templates_by_muscle_group, get_templates_by_muscle_groups, create_workout_plan, get_workout_plans, 
     get_workout_plan, assign_plan_to_client, get_client_plan,
-    update_booking_workout, get_pending_coach_decisions
+    update_booking_workout, get_pending_coach_decision_rows
 )
-from app.services.subscriptions import has_active_subscription
 
 router = APIRouter()
 
@@ -64,21 +66,23 @@ def read_workout_plan(plan_id: int, db: Session = Depends(get_db), current_user=
 # Assign plan to client (coaches only, requires client to have active subscription)
 @router.post("/assign-plan/")
 def assign_plan(assignment: AssignPlanToClient, db: Session = Depends(get_db), current_user=Depends(require_coach_role)):
+    # Client role, active subscription and coach assignment in one query
+    from app.crud.user import validate_coach_can_assign
+    checks = validate_coach_can_assign(db, current_user.id, assignment.client_id)
+    
     # Check if client exists and is a client
-    from app.crud.user import get_user_by_id, is_coach_client_relationship
-    client = get_user_by_id(db, assignment.client_id)
-    if not client or str(client.role) != "UserRole.CLIENT":
+    if not checks or checks.role != UserRole.CLIENT:
         raise HTTPException(status_code=400, detail="Invalid client")
     
     # Check if client has active subscription
-    if not has_active_subscription(assignment.client_id, db):
+    if not checks.has_active_subscription:
         raise HTTPException(
             status_code=403, 
             detail="Client must have an active subscription for plan assignment."
         )
     
     # Check if client belongs to this coach
-    if not is_coach_client_relationship(db, current_user.id, assignment.client_id):
+    if not checks.is_assigned:
         raise HTTPException(status_code=403, detail="You can only assign plans to your own clients")
     
     # Assign plan to client
@@ -91,7 +95,7 @@ def assign_plan(assignment: AssignPlanToClient, db: Session = Depends(get_db), c
 # Get client's assigned plan
 @router.get("/my-plan/", response_model=WorkoutPlanShow)
 def read_my_plan(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    if str(current_user.role) == "UserRole.CLIENT":
+    if current_user.role == UserRole.CLIENT:
         plan = get_client_plan(db, current_user.id)
         if not plan:
             raise HTTPException(status_code=404, detail="No plan assigned")
@@ -103,7 +107,7 @@ def read_my_plan(db: Session = Depends(get_db), current_user=Depends(get_current
 @router.get("/assigned")
 def get_assigned_workouts(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """Get workouts assigned to the current client"""
-    if str(current_user.role) != "UserRole.CLIENT":
+    if current_user.role != UserRole.CLIENT:
         raise HTTPException(status_code=403, detail="Only clients can view their assigned workouts")
     
     # For now, return empty list as this feature needs to be implemented
@@ -139,10 +143,10 @@ def get_booking_workout_templates(
         raise HTTPException(status_code=404, detail="Booking not found")
     
     # Check permissions
-    if str(current_user.role) == "UserRole.CLIENT" and str(booking.client_id) != str(current_user.id):
+    if current_user.role == UserRole.CLIENT and booking.client_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only view your own bookings")
     
-    client_id = int(str(booking.client_id))
+    client_id = booking.client_id
     
     # Get client's plan
     plan = get_client_plan(db, client_id)
@@ -150,7 +154,7 @@ def get_booking_workout_templates(
         raise HTTPException(status_code=404, detail="No workout plan assigned to client")
     
     # Calculate which day in the cycle this booking represents
-    workout_day = calculate_workout_day_for_booking(db, client_id, booking_id)
+    workout_day = calculate_workout_day_for_booking(db, client_id, booking_id, plan)
     
     # Get muscle groups for this day
     muscle_groups = get_muscle_groups_for_day(plan, workout_day)
@@ -163,14 +167,9 @@ def get_booking_workout_templates(
             "message": "No muscle groups defined for this day"
         }
     
-    # Get workout templates for these muscle groups
-    all_templates = []
-    for muscle_group in muscle_groups:
-        templates = get_templates_by_muscle_group(db, muscle_group.strip())
-        all_templates.extend(templates)
-    
-    # Remove duplicates
-    unique_templates = list({t.id: t for t in all_templates}.values())
+    # Get workout templates for these muscle groups in a single query
+    # (each template has one muscle group, so rows are already unique)
+    unique_templates = get_templates_by_muscle_groups(db, muscle_groups)
     
     return {
         "workout_day": workout_day,
@@ -180,28 +179,33 @@ def get_booking_workout_templates(
     }
 
 # Helper function to calculate workout day
-def calculate_workout_day_for_booking(db: Session, client_id: int, booking_id: int) -> str:
+def calculate_workout_day_for_booking(db: Session, client_id: int, booking_id: int, plan=None) -> str:
     """Calculate which day (A, B, C, etc.) this booking represents in the workout cycle"""
     from app.models.booking import Booking
-    from sqlalchemy import and_
+    from sqlalchemy import func, select, tuple_
     
-    # Get all confirmed bookings for this client, ordered by date
-    confirmed_bookings = db.query(Booking).filter(
-        and_(
+    # Position of the booking among the client's confirmed bookings (ordered by
+    # date, id) = number of confirmed bookings before it; counted in the database
+    booking_position = 0
+    current = db.execute(
+        select(Booking.date, Booking.id).where(
+            Booking.id == booking_id,
             Booking.client_id == client_id,
             Booking.status == 'confirmed'
         )
-    ).order_by(Booking.date, Booking.id).all()
-    
-    # Find the position of current booking
-    booking_position = 0
-    for i, b in enumerate(confirmed_bookings):
-        if b.id == booking_id:
-            booking_position = i
-            break
-    
-    # Get client's plan to know the cycle
-    plan = get_client_plan(db, client_id)
+    ).first()
+    if current:
+        booking_position = db.execute(
+            select(func.count()).select_from(Booking).where(
+                Booking.client_id == client_id,
+                Booking.status == 'confirmed',
+                tuple_(Booking.date, Booking.id) < tuple_(current.date, current.id)
+            )
+        ).scalar()
+    
+    # Get client's plan to know the cycle (callers that already loaded it pass it in)
+    if plan is None:
+        plan = get_client_plan(db, client_id)
     if not plan:
         return "A"  # Default to A if no plan
     
@@ -225,6 +229,8 @@ def calculate_workout_day_for_booking(db: Session, client_id: int, booking_id: i
     return days[day_index]
 
 # Helper function to get muscle groups for a specific day
+_MUSCLE_GROUP_SEPARATORS = re.compile(r'[+,&]')
+
 def get_muscle_groups_for_day(plan, day: str) -> List[str]:
     """Get muscle groups for a specific workout day"""
     day_mapping = {
@@ -240,8 +246,7 @@ def get_muscle_groups_for_day(plan, day: str) -> List[str]:
         return []
     
     # Parse muscle groups (assume they're separated by + or ,)
-    import re
-    muscle_groups = re.split(r'[+,&]', str(day_muscles))
+    muscle_groups = _MUSCLE_GROUP_SEPARATORS.split(str(day_muscles))
     return [mg.strip() for mg in muscle_groups if mg.strip()]
 
 # === BOOKING WORKOUTS ===
@@ -255,26 +260,20 @@ def get_available_workouts(booking_id: int, db: Session = Depends(get_db), curre
         raise HTTPException(status_code=404, detail="Booking not found")
     
     # Check permissions
-    if str(current_user.role) == "UserRole.CLIENT" and str(booking.client_id) != str(current_user.id):
+    if current_user.role == UserRole.CLIENT and booking.client_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only view your own bookings")
     
     # Get client's plan
-    client_id = int(str(booking.client_id))
+    client_id = booking.client_id
     plan = get_client_plan(db, client_id)
     if not plan:
         return {"available_workouts": [{"workout": "Let Coach Decide", "description": "Coach will choose the workout"}]}
     
-    available_workouts = []
-    if str(plan.day_a or ""):
-        available_workouts.append({"workout": f"A: {plan.day_a}", "description": f"Day A - {plan.day_a}"})
-    if str(plan.day_b or ""):
-        available_workouts.append({"workout": f"B: {plan.day_b}", "description": f"Day B - {plan.day_b}"})
-    if str(plan.day_c or ""):
-        available_workouts.append({"workout": f"C: {plan.day_c}", "description": f"Day C - {plan.day_c}"})
-    if str(plan.day_d or ""):
-        available_workouts.append({"workout": f"D: {plan.day_d}", "description": f"Day D - {plan.day_d}"})
-    if str(plan.day_e or ""):
-        available_workouts.append({"workout": f"E: {plan.day_e}", "description": f"Day E - {plan.day_e}"})
+    days = (("A", plan.day_a), ("B", plan.day_b), ("C", plan.day_c), ("D", plan.day_d), ("E", plan.day_e))
+    available_workouts = [
+        {"workout": f"{day}: {muscles}", "description": f"Day {day} - {muscles}"}
+        for day, muscles in days if muscles
+    ]
     
     available_workouts.append({"workout": "Let Coach Decide", "description": "Coach will choose the workout"})
     
@@ -289,7 +288,7 @@ def select_workout(selection: BookingWorkoutSelect, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Booking not found")
     
     # Check permissions
-    if str(current_user.role) == "UserRole.CLIENT" and str(booking.client_id) != str(current_user.id):
+    if current_user.role == UserRole.CLIENT and booking.client_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only select workouts for your own bookings")
     
     # Update booking with workout selection
@@ -305,7 +304,7 @@ def select_workout(selection: BookingWorkoutSelect, db: Session = Depends(get_db
 def coach_decide_workout(booking_id: int, decision: CoachDecideWorkout, db: Session = Depends(get_db), current_user=Depends(require_coach_role)):
     from app.crud.booking import get_booking
     booking = get_booking(db, booking_id)
-    if not booking or str(booking.coach_id) != str(current_user.id):
+    if not booking or booking.coach_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only decide workouts for your own bookings")
     
     updated_booking = update_booking_workout(db, booking_id, decision.workout_day, "decided", decision.notes or "")
@@ -314,5 +313,9 @@ def coach_decide_workout(booking_id: int, decision: CoachDecideWorkout, db: Sess
 # Get pending coach decisions
 @router.get("/pending-decisions/")
 def read_pending_decisions(db: Session = Depends(get_db), current_user=Depends(require_coach_role)):
-    pending = get_pending_coach_decisions(db, current_user.id)
-    return {"pending_decisions": [{"booking_id": b.id, "client_id": str(b.client_id), "date": b.date} for b in pending]}
+    rows = get_pending_coach_decision_rows(db, current_user.id)
+    # Plain column tuples, serialized straight by orjson (datetimes included)
+    return ORJSONResponse({"pending_decisions": [
+        {"booking_id": booking_id, "client_id": str(client_id), "date": date}
+        for booking_id, client_id, date in rows
+    ]})
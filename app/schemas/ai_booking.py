@@ -1,9 +1,72 @@
 # schemas/booking.py - AI Booking Schemas with Session Support
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import List, Optional
 from datetime import datetime
 
+# Example payloads shown in the OpenAPI docs
+_SESSION_BASED_BOOKING_REQUEST_EXAMPLE = {
+    "example": {
+        "session_token": "abc123-def456-ghi789",
+        "selected_slot_ids": [5, 42]
+    }
+}
+
+_SELECTIVE_BOOKING_REQUEST_EXAMPLE = {
+    "example": {
+        "client_id": 18,
+        "selected_suggestions": [
+            {
+                "slot_id": 5,
+                "coach_id": 1,
+                "date_suggestion": "2025-10-20",
+                "hour": 14,
+                "confidence_score": 1.0
+            }
+        ]
+    }
+}
+
+_SIMPLE_BOOKING_REQUEST_EXAMPLE = {
+    "example": {
+        "slot_ids": [5, 42]
+    }
+}
+
+_RE_SUGGESTION_REQUEST_EXAMPLE = {
+    "example": {
+        "client_id": 18,
+        "keep_suggestions": [
+            {
+                "slot_id": 5,
+                "coach_id": 1,
+                "date_suggestion": "2025-10-20",
+                "hour": 14,
+                "confidence_score": 1.0
+            }
+        ],
+        "exclude_suggestions": [
+            {
+                "slot_id": 42,
+                "coach_id": 1,
+                "date_suggestion": "2025-10-19",
+                "hour": 15,
+                "confidence_score": 1.0
+            }
+        ],
+        "replace_count": 2,
+        "preferred_date": "2025-10-21",
+        "days_flexibility": 3
+    }
+}
+
+_INDIVIDUAL_RE_SUGGESTION_REQUEST_EXAMPLE = {
+    "example": {
+        "session_token": "a61e962a-4c7b-4f51-b758-dd2c7285a0a2",
+        "slot_id": 42
+    }
+}
+
 class BookingSuggestion(BaseModel):
     """Single booking suggestion for selective booking"""
     slot_id: int
@@ -12,6 +75,8 @@ class BookingSuggestion(BaseModel):
     hour: int
     confidence_score: float
 
+    model_config = ConfigDict(frozen=True)
+
 class SuggestionResponse(BaseModel):
     """Enhanced suggestion response with session token"""
     message: str
@@ -32,66 +97,23 @@ class SessionBasedBookingRequest(BaseModel):
     session_token: str = Field(..., description="Session token from previous suggestions")
     selected_slot_ids: List[int] = Field(..., description="Slot IDs to book from the session")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "session_token": "abc123-def456-ghi789",
-                "selected_slot_ids": [5, 42]
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_SESSION_BASED_BOOKING_REQUEST_EXAMPLE)
     
 class SelectiveBookingRequest(BaseModel):
     """Request to book only selected suggestions"""
     client_id: int
     selected_suggestions: List[BookingSuggestion] = Field(..., description="List of selected suggestions to book")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "client_id": 18,
-                "selected_suggestions": [
-                    {
-                        "slot_id": 5,
-                        "coach_id": 1,
-                        "date_suggestion": "2025-10-20", 
-                        "hour": 14,
-                        "confidence_score": 1.0
-                    }
-                ]
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_SELECTIVE_BOOKING_REQUEST_EXAMPLE)
 
 class SimpleBookingRequest(BaseModel):
     """Simplified request to book by slot IDs only"""
     slot_ids: List[int] = Field(..., description="List of slot IDs to book")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "slot_ids": [5, 42]
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_SIMPLE_BOOKING_REQUEST_EXAMPLE)
 
-class SelectiveBookingRequestDetailed(BaseModel):
-    """Detailed request to book selected suggestions with validation"""
-    client_id: int
-    selected_suggestions: List[BookingSuggestion] = Field(..., description="List of selected suggestions to book")
-    
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "client_id": 18,
-                "selected_suggestions": [
-                    {
-                        "slot_id": 5,
-                        "coach_id": 1,
-                        "date_suggestion": "2025-10-20", 
-                        "hour": 14,
-                        "confidence_score": 1.0
-                    }
-                ]
-            }
-        }
+# Same fields as SelectiveBookingRequest; kept as an alias so only one schema is built
+SelectiveBookingRequestDetailed = SelectiveBookingRequest
 
 class ReSuggestionRequest(BaseModel):
     """Request to replace specific suggestions with new ones"""
@@ -102,33 +124,7 @@ class ReSuggestionRequest(BaseModel):
     preferred_date: Optional[str] = Field(None, description="Preferred date for new suggestions")
     days_flexibility: int = Field(3, ge=1, le=14, description="Days flexibility for new suggestions")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "client_id": 18,
-                "keep_suggestions": [
-                    {
-                        "slot_id": 5,
-                        "coach_id": 1,
-                        "date_suggestion": "2025-10-20",
-                        "hour": 14,
-                        "confidence_score": 1.0
-                    }
-                ],
-                "exclude_suggestions": [
-                    {
-                        "slot_id": 42,
-                        "coach_id": 1,
-                        "date_suggestion": "2025-10-19",
-                        "hour": 15,
-                        "confidence_score": 1.0
-                    }
-                ],
-                "replace_count": 2,
-                "preferred_date": "2025-10-21",
-                "days_flexibility": 3
-            }
-        }
+    model_config = ConfigDict(defer_build=True, json_schema_extra=_RE_SUGGESTION_REQUEST_EXAMPLE)
 
 class BookingResult(BaseModel):
     """Result of booking operation"""
@@ -139,28 +135,33 @@ class BookingResult(BaseModel):
     date: datetime
     status: str
     ai_generated: bool
+
+    model_config = ConfigDict(frozen=True)
     
+class FailedBooking(BaseModel):
+    """A requested slot that could not be booked"""
+    slot_id: int
+    reason: str
+
+    model_config = ConfigDict(frozen=True)
+
 class SelectiveBookingResponse(BaseModel):
     """Response for selective booking"""
     message: str
     successful_bookings: List[BookingResult]
-    failed_bookings: List[dict]
+    failed_bookings: List[FailedBooking]
     total_requested: int
     total_successful: int
     total_failed: int
+
+    model_config = ConfigDict(defer_build=True)
     
 class IndividualReSuggestionRequest(BaseModel):
     """Request to re-suggest a single slot"""
     session_token: str = Field(..., description="Session token from original suggestion")
     slot_id: int = Field(..., description="The specific slot ID to replace")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "session_token": "a61e962a-4c7b-4f51-b758-dd2c7285a0a2",
-                "slot_id": 42
-            }
-        }
+    model_config = ConfigDict(defer_build=True, json_schema_extra=_INDIVIDUAL_RE_SUGGESTION_REQUEST_EXAMPLE)
 
 class ReSuggestionResponse(BaseModel):
     """Response for re-suggestion request"""
@@ -168,4 +169,9 @@ class ReSuggestionResponse(BaseModel):
     kept_suggestions: List[BookingSuggestion]
     new_suggestions: List[dict]  # Same format as original suggestions
     total_suggestions: int
-    algorithm: str = "CP-SAT (Constraint Programming Satisfiability)"
\ No newline at end of file
+    algorithm: str = "CP-SAT (Constraint Programming Satisfiability)"
+
+    model_config = ConfigDict(defer_build=True)
+
+# Whole-list (de)serializer for suggestion lists, built once at import
+BOOKING_SUGGESTION_LIST = TypeAdapter(List[BookingSuggestion])
@@ -1,27 +1,76 @@
 # schemas/payment.py
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Literal, Annotated
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
 
+# Example payloads shown in the OpenAPI docs
+_CREATE_CHECKOUT_EXAMPLE = {
+    "example": {
+        "plan_id": "MONTHLY",
+        "return_url": "http://localhost:5173/dashboard?payment=success",
+        "cancel_url": "http://localhost:5173/dashboard?payment=cancelled"
+    }
+}
+
+_MANUAL_PAYMENT_CREATE_EXAMPLE = {
+    "example": {
+        "client_id": 1,
+        "amount": 150.00,
+        "currency": "ILS",
+        "plan_name": "Monthly Personal Training",
+        "duration_months": 1,
+        "status": "PAID",
+        "notes": "Cash payment received"
+    }
+}
+
+_PAYMENT_OUT_EXAMPLE = {
+    "example": {
+        "id": 1,
+        "client_id": 1,
+        "client_email": "client@example.com",
+        "client_phone": "+972-50-1234567",
+        "plan_id": "MONTHLY",
+        "plan_name": "Monthly",
+        "amount": "700.00",
+        "currency": "ILS",
+        "duration_months": 1,
+        "status": "PAID",
+        "paid_at": "2024-01-15T10:30:00Z",
+        "active_until": "2024-02-15T10:30:00Z",
+        "receipt_url": "https://paypal.com/activity/payment/...",
+        "is_active": True,
+        "paypal_order_id": "5O190127TN364715T",
+        "paypal_capture_id": "20G53990RR9087114"
+    }
+}
+
+_CHECKOUT_RESPONSE_EXAMPLE = {
+    "example": {
+        "checkout_url": "https://www.sandbox.paypal.com/checkoutnow?token=5O190127TN364715T",
+        "payment": {
+            "id": 1,
+            "plan_id": "MONTHLY",
+            "status": "REQUIRES_PAYMENT",
+            "amount": "700.00",
+            "paypal_order_id": "5O190127TN364715T"
+        }
+    }
+}
+
 class CreateCheckout(BaseModel):
     plan_id: Literal["MONTHLY", "QUARTERLY", "YEARLY"]
     return_url: Optional[str] = Field(None, description="URL to redirect after successful payment")
     cancel_url: Optional[str] = Field(None, description="URL to redirect after cancelled payment")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "plan_id": "MONTHLY",
-                "return_url": "http://localhost:5173/dashboard?payment=success",
-                "cancel_url": "http://localhost:5173/dashboard?payment=cancelled"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_CREATE_CHECKOUT_EXAMPLE)
 
 class ManualPaymentCreate(BaseModel):
     client_id: int = Field(..., description="ID of the client")
-    amount: Decimal = Field(..., gt=0, description="Payment amount")
+    # Bounded to the Numeric(10, 2) column so oversized values fail here, not at INSERT
+    amount: Annotated[Decimal, Field(gt=0, max_digits=10, decimal_places=2, description="Payment amount")]
     currency: str = Field(default="ILS", description="Currency code")
     plan_name: str = Field(..., description="Name/description of the payment")
     duration_months: int = Field(default=1, ge=1, description="Duration in months")
@@ -29,18 +78,7 @@ class ManualPaymentCreate(BaseModel):
     paid_at: Optional[datetime] = Field(None, description="When payment was completed")
     notes: Optional[str] = Field(None, description="Additional notes")
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "client_id": 1,
-                "amount": 150.00,
-                "currency": "ILS",
-                "plan_name": "Monthly Personal Training",
-                "duration_months": 1,
-                "status": "PAID",
-                "notes": "Cash payment received"
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_MANUAL_PAYMENT_CREATE_EXAMPLE)
 
 class PaymentOut(BaseModel):
     id: int
@@ -63,24 +101,27 @@ class PaymentOut(BaseModel):
     paypal_capture_id: Optional[str] = None
     
     @classmethod
-    def from_payment(cls, payment):
-        from datetime import datetime, timezone
-        
+    def from_payment(cls, payment, now: Optional[datetime] = None):
+        """Build the response for one payment; list endpoints pass a shared `now`"""
         # Handle timezone-aware comparison
-        now = datetime.now(timezone.utc)
+        if now is None:
+            now = datetime.now(timezone.utc)
+        status = payment.status.value
         if payment.active_until:
             # Make active_until timezone-aware if it's naive
             active_until = payment.active_until
             if active_until.tzinfo is None:
                 active_until = active_until.replace(tzinfo=timezone.utc)
             is_active = (
-                str(payment.status) == "PaymentStatus.PAID" and 
+                status == "PAID" and 
                 active_until >= now
             )
         else:
             is_active = False
         
-        return cls(
+        # Every value below is already in its final type (read from the DB row),
+        # so skip validation
+        return cls.model_construct(
             id=payment.id,
             client_id=payment.client_id,
             client_email=payment.client_email,
@@ -90,7 +131,7 @@ class PaymentOut(BaseModel):
             amount=str(payment.amount),
             currency=payment.currency,
             duration_months=payment.duration_months,
-            status=str(payment.status).replace("PaymentStatus.", ""),
+            status=status,
             paid_at=payment.paid_at,
             active_until=payment.active_until,
             receipt_url=payment.receipt_url,
@@ -99,46 +140,13 @@ class PaymentOut(BaseModel):
             paypal_capture_id=getattr(payment, 'paypal_capture_id', None)
         )
 
-    class Config:
-        from_attributes = True
-        json_schema_extra = {
-            "example": {
-                "id": 1,
-                "client_id": 1,
-                "client_email": "client@example.com",
-                "client_phone": "+972-50-1234567",
-                "plan_id": "MONTHLY",
-                "plan_name": "Monthly",
-                "amount": "700.00",
-                "currency": "ILS",
-                "duration_months": 1,
-                "status": "PAID",
-                "paid_at": "2024-01-15T10:30:00Z",
-                "active_until": "2024-02-15T10:30:00Z",
-                "receipt_url": "https://paypal.com/activity/payment/...",
-                "is_active": True,
-                "paypal_order_id": "5O190127TN364715T",
-                "paypal_capture_id": "20G53990RR9087114"
-            }
-        }
+    model_config = ConfigDict(from_attributes=True, json_schema_extra=_PAYMENT_OUT_EXAMPLE)
 
 class CheckoutResponse(BaseModel):
     checkout_url: str
     payment: PaymentOut
     
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "checkout_url": "https://www.sandbox.paypal.com/checkoutnow?token=5O190127TN364715T",
-                "payment": {
-                    "id": 1,
-                    "plan_id": "MONTHLY",
-                    "status": "REQUIRES_PAYMENT",
-                    "amount": "700.00",
-                    "paypal_order_id": "5O190127TN364715T"
-                }
-            }
-        }
+    model_config = ConfigDict(json_schema_extra=_CHECKOUT_RESPONSE_EXAMPLE)
 
 class PaymentStatusManual(BaseModel):
     status: Literal['PAID', 'FAILED', 'REFUNDED', 'CANCELED', 'EXPIRED']
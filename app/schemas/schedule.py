@@ -1,8 +1,8 @@
 # schemas/schedule.py
 # Pydantic schemas for scheduling system
 
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, computed_field, field_validator
+from typing import Literal, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -12,11 +12,23 @@ class PlanTypeEnum(str, Enum):
     PPL = "PPL"
     FIVE_DAY = "5DAY"
 
+# Slot positions as literal sets: 0=Monday .. 6=Sunday, bookable hours 8-21
+DayOfWeek = Literal[0, 1, 2, 3, 4, 5, 6]
+StartHour = Literal[8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21]
+
+def _validate_end_ge_start(v: Optional[int], info: ValidationInfo) -> Optional[int]:
+    """Shared preferred_end_hour check for the preference schemas"""
+    if v is not None:
+        start_hour = info.data.get('preferred_start_hour')
+        if start_hour is not None and v < start_hour:
+            raise ValueError('preferred_end_hour must be >= preferred_start_hour')
+    return v
+
 # ==================== SCHEDULE SLOT SCHEMAS ====================
 
 class ScheduleSlotBase(BaseModel):
-    day_of_week: int = Field(..., ge=0, le=6, description="0=Monday, 6=Sunday")
-    start_hour: int = Field(..., ge=8, le=21, description="Hour in 24h format (8-21)")
+    day_of_week: DayOfWeek = Field(..., description="0=Monday, 6=Sunday")
+    start_hour: StartHour = Field(..., description="Hour in 24h format (8-21)")
     coach_id: int
     capacity: int = Field(default=10, ge=1, le=20)
     is_active: bool = True
@@ -32,8 +44,22 @@ class ScheduleSlotOut(ScheduleSlotBase):
     current_occupancy: Optional[int] = None
     available_spots: Optional[int] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    @classmethod
+    def from_row(cls, row, occupancy: int) -> "ScheduleSlotOut":
+        """Build from a ScheduleSlot row plus its booking count, skipping validation"""
+        return cls.model_construct(
+            id=row.id,
+            day_of_week=row.day_of_week,
+            start_hour=row.start_hour,
+            coach_id=row.coach_id,
+            capacity=row.capacity,
+            is_active=row.is_active,
+            created_at=row.created_at,
+            current_occupancy=occupancy,
+            available_spots=row.capacity - occupancy
+        )
 
 class ScheduleSlotUpdate(BaseModel):
     capacity: Optional[int] = Field(None, ge=1, le=20)
@@ -59,8 +85,7 @@ class ClientPlanOut(ClientPlanBase):
     coach_name: Optional[str] = None
     coach_username: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ClientPlanUpdate(BaseModel):
     plan_type: Optional[PlanTypeEnum] = None
@@ -74,13 +99,7 @@ class ClientPreferenceBase(BaseModel):
     preferred_end_hour: Optional[int] = Field(None, ge=8, le=22)
     is_flexible: bool = False
     
-    @validator('preferred_end_hour')
-    def validate_time_range(cls, v, values):
-        if v is not None and 'preferred_start_hour' in values:
-            start_hour = values['preferred_start_hour']
-            if start_hour is not None and v < start_hour:
-                raise ValueError('preferred_end_hour must be >= preferred_start_hour')
-        return v
+    validate_time_range = field_validator('preferred_end_hour', mode='after')(_validate_end_ge_start)
 
 class ClientPreferenceCreate(ClientPreferenceBase):
     pass
@@ -90,71 +109,73 @@ class ClientPreferenceOut(ClientPreferenceBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ClientPreferenceUpdate(BaseModel):
     preferred_start_hour: Optional[int] = Field(None, ge=8, le=21)
     preferred_end_hour: Optional[int] = Field(None, ge=8, le=22)
     is_flexible: Optional[bool] = None
     
-    @validator('preferred_end_hour')
-    def validate_time_range(cls, v, values):
-        if v is not None and 'preferred_start_hour' in values:
-            start_hour = values['preferred_start_hour']
-            if start_hour is not None and v < start_hour:
-                raise ValueError('preferred_end_hour must be >= preferred_start_hour')
-        return v
+    validate_time_range = field_validator('preferred_end_hour', mode='after')(_validate_end_ge_start)
 
 # ==================== SCHEDULE ANALYTICS SCHEMAS ====================
 
 class SlotOccupancyOut(BaseModel):
     slot_id: int
-    day_of_week: int
-    start_hour: int
+    day_of_week: DayOfWeek
+    start_hour: StartHour
     coach_id: int
     capacity: int
     current_occupancy: int
     available_spots: int
     utilization_rate: float
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
-class WeekScheduleSummary(BaseModel):
-    week_start: str  # ISO format
+class DailyBreakdown(BaseModel):
+    day_of_week: DayOfWeek
     total_slots: int
     total_bookings: int
     total_capacity: int
     utilization_rate: float
     available_spots: int
+
+    model_config = ConfigDict(frozen=True)
+
+class WeekScheduleSummary(BaseModel):
+    week_start: str  # ISO format
+    total_slots: int
+    total_bookings: int
+    total_capacity: int
     
     # Breakdown by day
-    daily_breakdown: Optional[List[dict]] = None
+    daily_breakdown: Optional[List[DailyBreakdown]] = None
     
     # Most/least popular slots
     busiest_slots: Optional[List[SlotOccupancyOut]] = None
     available_slots: Optional[List[SlotOccupancyOut]] = None
 
+    # Derived from the counts above so they can never disagree with them
+    @computed_field
+    @property
+    def utilization_rate(self) -> float:
+        # Percentage, same as crud.schedule.get_week_schedule_summary
+        if not self.total_capacity:
+            return 0.0
+        return round(self.total_bookings / self.total_capacity * 100, 2)
+
+    @computed_field
+    @property
+    def available_spots(self) -> int:
+        return self.total_capacity - self.total_bookings
+
 # ==================== ADMIN SCHEMAS ====================
 
 class BulkSlotCreate(BaseModel):
     coach_id: int
-    days_of_week: List[int] = Field(..., description="List of days (0=Monday, 6=Sunday)")
-    start_hours: List[int] = Field(..., description="List of hours (8-21)")
+    days_of_week: List[DayOfWeek] = Field(..., description="List of days (0=Monday, 6=Sunday)")
+    start_hours: List[StartHour] = Field(..., description="List of hours (8-21)")
     capacity: int = Field(default=10, ge=1, le=20)
-    
-    @validator('days_of_week')
-    def validate_days(cls, v):
-        if not all(0 <= day <= 6 for day in v):
-            raise ValueError('All days must be between 0 (Monday) and 6 (Sunday)')
-        return v
-    
-    @validator('start_hours')
-    def validate_hours(cls, v):
-        if not all(8 <= hour <= 21 for hour in v):
-            raise ValueError('All hours must be between 8 and 21')
-        return v
 
 class BulkSlotCreateResponse(BaseModel):
     created_slots: int
@@ -190,8 +211,7 @@ class PlanRequestOut(PlanRequestBase):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PlanRequestUpdate(BaseModel):
     status: str = Field(..., description="APPROVED or REJECTED")
@@ -1,6 +1,6 @@
 # schemas/user.py
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -30,19 +30,21 @@ class UserCreate(BaseModel):
     phone: Optional[str] = None
     plan: Optional[str] = None  # Plan assigned to client (e.g., "ABC", "AB")
 
-# Response data sent back to client
-class UserOut(BaseModel):
+# Fields shared by the user response models below
+class _UserCore(BaseModel):
     id: int
     username: str
     email: EmailStr
-    role: UserRole
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     phone: Optional[str] = None
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+# Response data sent back to client
+class UserOut(_UserCore):
+    role: UserRole
 
 # Limited coach information (i dont want users to see coach emial for exmaple...)
 class CoachLimited(BaseModel):
@@ -106,30 +108,11 @@ class UserProfile(BaseModel):
         from_attributes = True
 
 # For coach-client relationships
-class ClientOut(BaseModel):
-    id: int
-    username: str
-    email: EmailStr
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    phone: Optional[str] = None
-    created_at: datetime
+class ClientOut(_UserCore):
     assigned_coach: Optional['CoachLimited'] = None
 
-    class Config:
-        from_attributes = True
-
-class CoachOut(BaseModel):
-    id: int
-    username: str
-    email: EmailStr
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    phone: Optional[str] = None
-    created_at: datetime
-
-    class Config:
-        from_attributes = True
+class CoachOut(_UserCore):
+    pass
 
 # Membership information for client profiles
 class MembershipInfo(BaseModel):
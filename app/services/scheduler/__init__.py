@@ -21,13 +21,24 @@ Key Components:
 - explainer.py: Human-readable explanation generation
 """
 
-from .cp_sat_solver import (
-    CPSATScheduler, 
-    SchedulingResult, 
-    SlotExplainer, 
-    SuggestionReason, 
-    ConstraintWeights
-)
+import importlib
+
+# cp_sat_solver pulls in OR-Tools, so it is only imported on first use (PEP 562)
+_LAZY_ATTRS = {
+    'CPSATScheduler': 'cp_sat_solver',
+    'SchedulingResult': 'cp_sat_solver',
+    'SlotExplainer': 'cp_sat_solver',
+    'SuggestionReason': 'cp_sat_solver',
+    'ConstraintWeights': 'cp_sat_solver'
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module = importlib.import_module('.' + _LAZY_ATTRS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'CPSATScheduler',
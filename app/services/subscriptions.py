@@ -3,6 +3,8 @@
 from decimal import Decimal
 from typing import TypedDict
 from datetime import datetime, timezone
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import exists, select
 from sqlalchemy.orm import Session
 from app.models.payment import Payment, PaymentStatus
 
@@ -25,14 +27,22 @@ def get_plan(plan_id: str) -> Plan:
         raise ValueError(f"Unknown plan_id: {plan_id}")
     return p
 
-def has_active_subscription(client_id: int, db: Session) -> bool:
-    """Check if client has an active paid subscription"""
+def subscription_active_until(paid_at: datetime, duration_months: int) -> datetime:
+    """End of a subscription paid at `paid_at`, in calendar months (Jan 31 + 1 month = Feb 28/29)"""
+    return paid_at + relativedelta(months=duration_months)
+
+def active_subscription_exists(client_id):
+    """EXISTS clause: the client (an id or a column) has a paid, unexpired payment"""
     now = datetime.now(timezone.utc)
-    return db.query(Payment).filter(
+    return exists().where(
         Payment.client_id == client_id,
         Payment.status == PaymentStatus.PAID,
         Payment.active_until >= now
-    ).first() is not None
+    )
+
+def has_active_subscription(client_id: int, db: Session) -> bool:
+    """Check if client has an active paid subscription"""
+    return db.execute(select(active_subscription_exists(client_id))).scalar() is True
 
 def infer_plan_from_legacy_payment(amount: Decimal, duration_months: int) -> tuple[str, str]:
     """Infer plan_id and plan_name from legacy payment data"""
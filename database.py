@@ -3,6 +3,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+import orjson
 
 # Load variables from .env
 load_dotenv()
@@ -14,8 +15,20 @@ if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in the .env file")
 
 # Create engine and session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# JSON columns are encoded/decoded with orjson (much faster than stdlib json)
+# Pool sized for the worker's threadpool; pre-ping and recycle drop connections
+# MySQL has closed (wait_timeout) instead of failing the next request
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads
+)
+# expire_on_commit=False: objects stay readable after commit without a reload SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Base class for models to inherit from
 Base = declarative_base()